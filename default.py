@@ -159,10 +159,9 @@ def make_local():
             fileman.downloadfor(mediaitem)
             newart = dict((k, v) for k, v in mediaitem.downloadedart.iteritems()
                 if not v or not v.startswith('http'))
-            for arttype in newart:
-                # remove old URL from texture cache
-                if mediaitem.art.get(arttype, '').startswith('http'):
-                    quickjson.remove_texture_byurl(mediaitem.art[arttype])
+            # remove old URLs from texture cache
+            quickjson.remove_textures_byurl([mediaitem.art[arttype] for arttype in newart
+                if mediaitem.art.get(arttype, '').startswith('http')])
             return newart
         except FileError as ex:
             mediaitem.error = ex.message
@@ -180,8 +179,15 @@ def cache_artwork(librarytype='videos'):
             xbmcgui.NOTIFICATION_WARNING)
         return
     heading = L(M.CACHE_VIDEO_ARTWORK if librarytype == 'videos' else M.CACHE_MUSIC_ARTWORK)
-    cached = runon_medialist(lambda mi: fileman.cachefor(mi.art, True), heading, librarytype, fg=True)
-    xbmcgui.Dialog().ok("Artwork Beef", L(M.CACHED_COUNT).format(cached))
+    result = {'cached': 0}
+    def finish(progress, canceled):
+        # the dialog stays up while the rest of the queue is cached, and can still be canceled
+        def onprogress(done, queued):
+            progress.update(done * 100 // queued if queued else 100, L(M.CACHED_COUNT).format(done))
+        result['cached'] = fileman.finish_caching(canceled(), canceled, onprogress)
+    # images already in the texture cache are skipped, so a canceled run picks up where it stopped
+    runon_medialist(lambda mi: fileman.cachefor(mi.art, True), heading, librarytype, fg=True, finish_fn=finish)
+    xbmcgui.Dialog().ok("Artwork Beef", L(M.CACHED_COUNT).format(result['cached']))
 
 def identify_unmatched(mediatype):
     busy = pykodi.get_busydialog()
@@ -244,33 +250,35 @@ def set_autoaddepisodes():
         if xbmcgui.Dialog().yesno(L(M.ADD_MISSING_HEADER), L(M.ADD_MISSING_MESSAGE)):
             pykodi.execute_builtin('NotifyAll(script.artwork.beef:control, ProcessAfterSettings)')
 
-def runon_medialist(function, heading, medialist='videos', typelabel=None, fg=False):
+def runon_medialist(function, heading, medialist='videos', typelabel=None, fg=False, finish_fn=None):
+    '''`finish_fn(progress, canceled)` is called before the progress dialog is closed.'''
     progress = xbmcgui.DialogProgress() if fg else xbmcgui.DialogProgressBG()
     progress.create(heading)
     monitor = xbmc.Monitor()
 
     if medialist == 'videos':
-        steps_to_run = [(lambda: quickjson.get_item_list(mediatypes.MOVIE), L(M.MOVIES)),
+        steps_to_run = [(lambda: quickjson.iter_item_list(mediatypes.MOVIE), L(M.MOVIES)),
             (info.get_cached_tvshows, L(M.SERIES)),
             (quickjson.get_seasons, L(M.SEASONS)),
-            (lambda: quickjson.get_item_list(mediatypes.MOVIESET), L(M.MOVIESETS)),
-            (quickjson.get_episodes, L(M.EPISODES)),
-            (lambda: quickjson.get_item_list(mediatypes.MUSICVIDEO), L(M.MUSICVIDEOS))]
+            (lambda: quickjson.iter_item_list(mediatypes.MOVIESET), L(M.MOVIESETS)),
+            (quickjson.iter_episodes, L(M.EPISODES)),
+            (lambda: quickjson.iter_item_list(mediatypes.MUSICVIDEO), L(M.MUSICVIDEOS))]
     elif medialist == 'music' and get_kodi_version() >= 18:
-        steps_to_run = [(lambda: quickjson.get_item_list(mediatypes.ARTIST), L(M.ARTISTS)),
-            (lambda: quickjson.get_item_list(mediatypes.ALBUM), L(M.ALBUMS)),
-            (lambda: quickjson.get_item_list(mediatypes.SONG), L(M.SONGS))]
+        steps_to_run = [(lambda: quickjson.iter_item_list(mediatypes.ARTIST), L(M.ARTISTS)),
+            (lambda: quickjson.iter_item_list(mediatypes.ALBUM), L(M.ALBUMS)),
+            (lambda: quickjson.iter_item_list(mediatypes.SONG), L(M.SONGS))]
     else:
         steps_to_run = ((lambda: medialist, typelabel),)
     stepsize = 100 // len(steps_to_run)
 
     def update_art_for_items(items, start):
         changedcount = 0
+        itemcount = len(items)
         for i, item in enumerate(items):
             if fg:
-                progress.update(start + i * stepsize // len(items), item['label'])
+                progress.update(start + i * stepsize // itemcount, item['label'])
             else:
-                progress.update(start + i * stepsize // len(items))
+                progress.update(start + i * stepsize // itemcount)
             item = info.MediaItem(item)
             if item.mediatype == mediatypes.SEASON:
                 item.file = info.get_cached_tvshow(item.tvshowid)['file']
@@ -298,6 +306,8 @@ def runon_medialist(function, heading, medialist='videos', typelabel=None, fg=Fa
             break
 
     info.clear_cache()
+    if finish_fn:
+        finish_fn(progress, lambda: monitor.abortRequested() or fg and progress.iscanceled())
     progress.close()
     return fixcount
 
@@ -1,24 +1,31 @@
 import random
+import sys
 import xbmc
 import xbmcgui
 from datetime import timedelta
+from functools import wraps
 
 from lib import cleaner, reporting
 from lib.artworkselection import prompt_for_artwork
 from lib.filemanager import FileManager, FileError
 from lib.gatherer import Gatherer
-from lib.libs import mediainfo as info, mediatypes, pykodi, quickjson
+from lib.libs import dirindex, mediainfo as info, mediatypes, pykodi, quickjson, threadpool, webhelper
 from lib.libs.addonsettings import settings, PROGRESS_DISPLAY_FULLPROGRESS, PROGRESS_DISPLAY_NONE
 from lib.libs.processeditems import ProcessedItems
 from lib.libs.pykodi import datetime_now, get_kodi_version, localize as L, log
-from lib.libs.utils import SortedDisplay, natural_sort, get_simpledict_updates
-from lib.providers import search
+from lib.libs.utils import SortedDisplay, get_simpledict_updates
+from lib.providers import base as providerbase, search
 
 MODE_AUTO = 'auto'
 MODE_GUI = 'gui'
 MODE_DEBUG = 'debug'
 
-THROTTLE_TIME = 0.15
+# items waiting between each processing stage
+PIPELINE_QUEUESIZE = 2
+# processed item updates saved together in one transaction
+PROCESSED_BATCHSIZE = 100
+# local images checked against the texture cache together, see `FileManager.cacheurls`
+CACHE_BATCHSIZE = 500
 
 SOMETHING_MISSING = 32001
 FINAL_MESSAGE = 32019
@@ -34,15 +41,46 @@ ENTER_ARTIST_TRACK_NAMES = 32058
 NO_IDS_MESSAGE = 32030
 FILENAME_ENCODING_ERROR = 32040
 
+class ItemJob(object):
+    '''Working state for one media item as it moves through the processing stages.'''
+    def __init__(self, mediaitem, singleitem=False, auto=True):
+        self.mediaitem = mediaitem
+        self.singleitem = singleitem
+        self.auto = auto
+        self.services_hit = False
+        self.error = None
+        self.cleaned = {}
+        self.toset = {}
+        self.exc_info = None
+
+def _stage(method):
+    # hold on to exceptions so they are raised from the library write stage, in item order
+    @wraps(method)
+    def wrapper(self, job):
+        if job.exc_info:
+            return
+        try:
+            method(self, job)
+        except Exception:
+            job.exc_info = sys.exc_info()
+    return wrapper
+
 class ArtworkProcessor(object):
     def __init__(self, monitor=None):
         self.monitor = monitor or xbmc.Monitor()
+        # missing art requirements by media type, for the list being processed
+        self.missingtables = {}
+        # the service's monitor also reports a canceled run
+        webhelper.set_abort_check(self.monitor.abortRequested)
         self.language = None
         self.autolanguages = None
         self.progress = xbmcgui.DialogProgressBG()
         self.visible = False
         self.freshstart = "0"
         self.processed = ProcessedItems()
+        self.processed_updates = []
+        self.cache_urls = []
+        self.journal = None
         self.gatherer = None
         self.downloader = None
         self.chunkcount = 1
@@ -104,7 +142,9 @@ class ArtworkProcessor(object):
         self.debug = debug
 
     def finish_run(self):
+        self.flush_cache()
         info.clear_cache()
+        providerbase.cache.clear()
         self.downloader = None
         self.set_debug(False)
         self.close_progress()
@@ -257,81 +297,144 @@ class ArtworkProcessor(object):
 
     def _process_chunk(self, medialist, currentchunk, singleitem):
         self.currentchunk = currentchunk
-        artcount = 0
-        currentitem = 0
-        aborted = False
+        self.missingtables = {}
+        # listings only help items in the same list, so don't carry them across the whole library
+        dirindex.index.clear()
         singleitemlist = len(medialist) == 1 and currentchunk == 1
-        for mediaitem in medialist:
-            if mediaitem.mediatype in mediatypes.audiotypes and get_kodi_version() < 18:
-                continue
-            self.update_progress(currentitem * 100 // len(medialist), mediaitem.label)
-            info.add_additional_iteminfo(mediaitem, self.processed, None if self.localmode else search)
-            currentitem += 1
+        jobs = [ItemJob(mediaitem, singleitem) for mediaitem in medialist
+            if (mediaitem.mediatype not in mediatypes.audiotypes or get_kodi_version() >= 18)
+            and not (self.journal and self.journal.is_done(mediaitem))]
+        counts = {'items': 0, 'art': 0, 'aborted': False}
+        def finish_item(job):
+            # library writes, reporting, and abort checks stay on this thread and in list order
+            mediaitem = job.mediaitem
+            self.update_progress(counts['items'] * 100 // len(jobs), mediaitem.label)
+            counts['items'] += 1
             try:
-                services_hit = self._process_item(mediaitem, singleitem)
+                self._write_stage(job)
             except FileError as ex:
-                services_hit = True
                 mediaitem.error = ex.message
                 log(ex.message, xbmc.LOGERROR)
                 self.notify_warning(ex.message, None, True)
             reporting.report_item(mediaitem, singleitemlist or mediaitem.error)
-            artcount += len(mediaitem.updatedart)
+            counts['art'] += len(mediaitem.updatedart)
+            if self.journal:
+                self.journal.mark_done(mediaitem)
 
-            if not services_hit:
-                if self.monitor.abortRequested():
-                    aborted = True
-                    break
-            elif self.monitor.waitForAbort(THROTTLE_TIME):
-                aborted = True
-                break
-        return aborted, currentitem, artcount
+            # web services are throttled per host as requests are made, see `webhelper.RateLimiter`
+            counts['aborted'] = self.monitor.abortRequested()
+            return counts['aborted']
+
+        try:
+            threadpool.run_pipeline(jobs, (self._prefetch_stage, self._prepare_stage, self._gather_stage,
+                self._select_stage, self._download_stage), finish_item, PIPELINE_QUEUESIZE)
+        finally:
+            self.flush_processed()
+        return counts['aborted'], counts['items'], counts['art']
 
     def _process_item(self, mediaitem, singleitem=False, auto=True):
-        mediatype = mediaitem.mediatype
+        job = ItemJob(mediaitem, singleitem, auto)
+        self.missingtables = {}
+        for stage in (self._prepare_stage, self._gather_stage, self._select_stage, self._download_stage):
+            stage(job)
+        try:
+            return self._write_stage(job)
+        finally:
+            self.flush_processed()
+
+    def flush_processed(self):
+        updates = self.processed_updates
+        self.processed_updates = []
+        self.processed.set_many(updates)
+        if self.journal:
+            self.journal.flush()
+        self.flush_cache()
+
+    def flush_cache(self):
+        urls = self.cache_urls
+        self.cache_urls = []
+        if self.monitor.abortRequested():
+            # Kodi's web server may be gone already, these will be cached by the next run
+            return
+        if urls and self.downloader:
+            self.downloader.cacheurls(urls, abort_requested=self.monitor.abortRequested)
+
+    @_stage
+    def _prefetch_stage(self, job):
+        info.add_additional_iteminfo(job.mediaitem, self.processed, None if self.localmode else search)
+
+    @_stage
+    def _prepare_stage(self, job):
+        mediaitem = job.mediaitem
         onlyfs = self.localmode or mediatypes.only_filesystem(mediaitem.mediatype)
         if not mediaitem.uniqueids and not onlyfs:
             mediaitem.missingid = True
-            if singleitem:
+            if job.singleitem:
                 header = L(NO_IDS_MESSAGE)
-                message = "{0} '{1}'".format(mediatype, mediaitem.label)
+                message = "{0} '{1}'".format(mediaitem.mediatype, mediaitem.label)
                 log(header + ": " + message, xbmc.LOGNOTICE)
                 xbmcgui.Dialog().notification("Artwork Beef: " + header, message, xbmcgui.NOTIFICATION_INFO)
 
-        if auto:
+        if job.auto:
             cleaned = get_simpledict_updates(mediaitem.art, cleaner.clean_artwork(mediaitem))
             if cleaned:
-                if not self.debug:
-                    add_art_to_library(mediatype, mediaitem.seasons, mediaitem.dbid, cleaned)
+                job.cleaned = cleaned
                 mediaitem.art.update(cleaned)
                 mediaitem.art = dict(item for item in mediaitem.art.iteritems() if item[1])
 
-        mediaitem.missingart = list(info.iter_missing_arttypes(mediaitem, mediaitem.art))
+    @_stage
+    def _gather_stage(self, job):
+        mediaitem = job.mediaitem
+        onlyfs = self.localmode or mediatypes.only_filesystem(mediaitem.mediatype)
+        mediaitem.missingart = list(info.iter_missing_arttypes(mediaitem, mediaitem.art, self.missingtables))
 
-        services_hit, error = self.gatherer.getartwork(mediaitem, onlyfs, auto)
+        job.services_hit, job.error = self.gatherer.getartwork(mediaitem, onlyfs, job.auto)
 
-        if auto:
-            existingart = dict(mediaitem.art)
-            selectedart = dict((key, image['url']) for key, image in mediaitem.forcedart.iteritems())
-            existingart.update(selectedart)
+    @_stage
+    def _select_stage(self, job):
+        if not job.auto:
+            return
+        mediaitem = job.mediaitem
+        existingart = dict(mediaitem.art)
+        selectedart = dict((key, image['url']) for key, image in mediaitem.forcedart.iteritems())
+        existingart.update(selectedart)
+
+        # Then add the rest of the missing art
+        selectedart.update(self.get_top_missing_art(info.iter_missing_arttypes(mediaitem, existingart,
+            self.missingtables),
+            mediaitem.mediatype, existingart, mediaitem.availableart))
+
+        selectedart = get_simpledict_updates(mediaitem.art, selectedart)
+        mediaitem.selectedart = selectedart
+        job.toset = dict(selectedart)
+
+    @_stage
+    def _download_stage(self, job):
+        mediaitem = job.mediaitem
+        if not job.auto or self.localmode or not mediatypes.downloadanyartwork(mediaitem.mediatype):
+            return
+        sh, er = self.downloader.downloadfor(mediaitem)
+        job.services_hit = job.services_hit or sh
+        job.error = job.error or er
+        job.toset.update(mediaitem.downloadedart)
 
-            # Then add the rest of the missing art
-            selectedart.update(self.get_top_missing_art(info.iter_missing_arttypes(mediaitem, existingart),
-                mediatype, existingart, mediaitem.availableart))
+    def _write_stage(self, job):
+        mediaitem = job.mediaitem
+        mediatype = mediaitem.mediatype
+        if job.cleaned and not self.debug:
+            add_art_to_library(mediatype, mediaitem.seasons, mediaitem.dbid, job.cleaned)
+        if job.exc_info:
+            threadpool.reraise(job.exc_info)
 
-            selectedart = get_simpledict_updates(mediaitem.art, selectedart)
-            mediaitem.selectedart = selectedart
-            toset = dict(selectedart)
-            if not self.localmode and mediatypes.downloadanyartwork(mediaitem.mediatype):
-                sh, er = self.downloader.downloadfor(mediaitem)
-                services_hit = services_hit or sh
-                error = error or er
-                toset.update(mediaitem.downloadedart)
+        if job.auto:
+            toset = job.toset
             if toset:
                 mediaitem.updatedart = list(set(mediaitem.updatedart + toset.keys()))
                 if not self.debug:
                     add_art_to_library(mediatype, mediaitem.seasons, mediaitem.dbid, toset)
             self.cachelocal(mediaitem, toset)
 
+        error = job.error
         if error:
             if isinstance(error, basestring) or 'message' not in error:
                 header = None
@@ -341,13 +444,9 @@ class ArtworkProcessor(object):
             mediaitem.error = error
             log(error, xbmc.LOGWARNING)
             self.notify_warning(error, header)
-        elif auto and not self.debug and not self.localmode:
-            if not (mediatype == mediatypes.EPISODE and 'fanart' in mediaitem.skip_artwork) and \
-                    mediatype != mediatypes.SONG:
-                self.processed.set_nextdate(mediaitem.dbid, mediatype, mediaitem.label,
-                    datetime_now() + timedelta(days=self.get_nextcheckdelay(mediaitem)))
-            if mediatype == mediatypes.TVSHOW:
-                self.processed.set_data(mediaitem.dbid, mediatype, mediaitem.label, mediaitem.season)
+        elif job.auto and not self.debug and not self.localmode:
+            # saved together with `flush_processed`
+            self.add_processed(mediaitem)
         if mediaitem.borked_filename:
             msg = L(FILENAME_ENCODING_ERROR).format(mediaitem.file)
             if not mediaitem.error:
@@ -355,7 +454,7 @@ class ArtworkProcessor(object):
             log(msg, xbmc.LOGWARNING)
         if self.debug:
             log(mediaitem, xbmc.LOGNOTICE)
-        return services_hit
+        return job.services_hit
 
     def cachelocal(self, mediaitem, toset):
         ismusic = mediaitem.mediatype in mediatypes.audiotypes
@@ -363,7 +462,31 @@ class ArtworkProcessor(object):
                 settings.cache_local_music_artwork and ismusic:
             artmap = dict(mediaitem.art)
             artmap.update(toset)
-            self.downloader.cachefor(artmap)
+            # saved together with `flush_cache`
+            self.cache_urls.extend(artmap.itervalues())
+            if len(self.cache_urls) >= CACHE_BATCHSIZE:
+                self.flush_cache()
+
+    def add_processed(self, mediaitem):
+        update = {'mediaid': mediaitem.dbid, 'mediatype': mediaitem.mediatype, 'medialabel': mediaitem.label}
+        if not (mediaitem.mediatype == mediatypes.EPISODE and 'fanart' in mediaitem.skip_artwork) and \
+                mediaitem.mediatype != mediatypes.SONG:
+            update['nextdate'] = datetime_now() + timedelta(days=self.get_nextcheckdelay(mediaitem))
+        if mediaitem.mediatype == mediatypes.TVSHOW:
+            update['data'] = mediaitem.season
+        if 'nextdate' in update or 'data' in update:
+            self.processed_updates.append(update)
+            if len(self.processed_updates) >= PROCESSED_BATCHSIZE:
+                self.flush_processed()
+
+    def set_complete(self, medialist):
+        '''Record items left out of a run because they have all of their artwork, so they are checked again
+        after the usual delay rather than on every run.'''
+        if self.debug or self.localmode:
+            return
+        for mediaitem in medialist:
+            self.add_processed(mediaitem)
+        self.flush_processed()
 
     def get_nextcheckdelay(self, mediaitem):
         weeks = 4 if mediatypes.only_filesystem(mediaitem.mediatype) \
@@ -421,8 +544,7 @@ class ArtworkProcessor(object):
                         existingurls.append(url)
                         existingartnames.append(art)
 
-                newart = [art for art in availableart[missingart] if
-                    self._auto_filter(missingart, art, mediatype, availableart[missingart], existingurls)]
+                newart = list(self._iter_autofiltered(missingart, mediatype, availableart[missingart], existingurls))
                 if not newart:
                     continue
                 newartcount = 0
@@ -436,37 +558,43 @@ class ArtworkProcessor(object):
                         newartwork[exacttype] = newart[newartcount]['url']
                         newartcount += 1
             else:
-                newart = next((art for art in availableart[missingart] if
-                    self._auto_filter(missingart, art, mediatype, availableart[missingart])), None)
+                newart = next(self._iter_autofiltered(missingart, mediatype, availableart[missingart]), None)
                 if newart:
                     newartwork[missingart] = newart['url']
         return newartwork
 
-    def _auto_filter(self, basearttype, art, mediatype, availableart, ignoreurls=(), skippreferred=False):
+    def _iter_autofiltered(self, basearttype, mediatype, artlist, ignoreurls=()):
+        # one pass to see if any image from the preferred source would do, then those from other sources are out
+        skipothers = mediatypes.haspreferred_source(mediatype) and any(self._auto_filter(basearttype, art)
+            for art in artlist if mediatypes.ispreferred_source(mediatype, art['provider'][0]))
+        ignoreurls = set(ignoreurls)
+        for art in artlist:
+            if skipothers and not mediatypes.ispreferred_source(mediatype, art['provider'][0]):
+                continue
+            if art['url'] not in ignoreurls and self._auto_filter(basearttype, art):
+                yield art
+
+    def _auto_filter(self, basearttype, art):
         if art['rating'].sort < settings.minimum_rating:
             return False
-        if not skippreferred and mediatypes.haspreferred_source(mediatype) and \
-            not mediatypes.ispreferred_source(mediatype, art['provider'][0]) and \
-            any(1 for i in availableart if mediatypes.ispreferred_source(mediatype, i['provider'][0]) and
-                self._auto_filter(basearttype, i, mediatype, availableart, ignoreurls, True)):
-            return False
         if basearttype.endswith('fanart') and art['size'].sort < settings.minimum_size:
             return False
         if art['provider'].sort == 'theaudiodb.com' or not art['language'] and \
             (basearttype.endswith('poster') and settings.titlefree_poster or
                 basearttype.endswith(('fanart', 'keyart', 'characterart'))):
-            return skippreferred or art['url'] not in ignoreurls
-        return art['language'] in self.autolanguages and (skippreferred or art['url'] not in ignoreurls)
+            return True
+        return art['language'] in self.autolanguages
 
 def add_art_to_library(mediatype, seasons, dbid, selectedart):
     if not selectedart:
         return
     if mediatype == mediatypes.TVSHOW:
-        for season, season_id in seasons.iteritems():
-            info.update_art_in_library(mediatypes.SEASON, season_id, dict((arttype.split('.')[2], url)
+        updates = [(mediatypes.SEASON, season_id, dict((arttype.split('.')[2], url)
                 for arttype, url in selectedart.iteritems() if arttype.startswith('season.{0}.'.format(season))))
-        info.update_art_in_library(mediatype, dbid, dict((arttype, url)
-            for arttype, url in selectedart.iteritems() if '.' not in arttype))
+            for season, season_id in seasons.iteritems()]
+        updates.append((mediatype, dbid, dict((arttype, url)
+            for arttype, url in selectedart.iteritems() if '.' not in arttype)))
+        info.update_many_art_in_library(updates)
     else:
         info.update_art_in_library(mediatype, dbid, selectedart)
     info.remove_local_from_texturecache(selectedart.values())
@@ -488,7 +616,7 @@ def populate_musiccentraldir():
 
 def tag_forcedandexisting_art(availableart, forcedart, existingart):
     typeinsert = {}
-    for exacttype, artlist in sorted(forcedart.iteritems(), key=lambda arttype: natural_sort(arttype[0])):
+    for exacttype, artlist in sorted(forcedart.iteritems(), key=lambda arttype: mediatypes.arttype_sortkey(arttype[0])):
         arttype = info.get_basetype(exacttype)
         if arttype not in availableart:
             availableart[arttype] = artlist
@@ -513,6 +641,6 @@ def tag_forcedandexisting_art(availableart, forcedart, existingart):
                 match['existing'] = True
             else:
                 typeinsert[arttype] = typeinsert[arttype] + 1 if arttype in typeinsert else 0
-                image = {'url': existingurl, 'preview': existingurl, 'title': exacttype,
-                    'existing': True, 'provider': SortedDisplay('current', L(CURRENT_ART))}
+                image = providerbase.ImageCandidate(url=existingurl, preview=existingurl, title=exacttype,
+                    existing=True, provider=SortedDisplay('current', L(CURRENT_ART)))
                 availableart[arttype].insert(typeinsert[arttype], image)
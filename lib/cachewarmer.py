@@ -0,0 +1,168 @@
+import sys
+import threading
+import time
+import urllib
+import xbmc
+from contextlib import closing
+try:
+    from queue import Queue
+except ImportError: # py2
+    from Queue import Queue
+from requests.exceptions import HTTPError, ConnectionError, RequestException
+
+from lib.libs import pykodi
+from lib.libs.pykodi import log
+from lib.libs.webhelper import Getter
+
+# Kodi decodes and resizes each image as it is cached, and `webhelper.HOST_CONCURRENCY` limits
+#  requests to it anyway, so more threads than that only wait
+CACHE_THREADS = 4
+# paths waiting for a worker; adding more blocks, so listing the library can't run far ahead of caching
+CACHE_QUEUESIZE = 200
+CHUNK_SIZE = 64 * 1024
+LOG_EVERY = 500
+
+class CacheWarmer(object):
+    '''Requests images from Kodi's web server so Kodi adds them to its texture cache, on a fixed pool
+    of worker threads that share one session, so connections to Kodi are kept open between images.
+    Workers start with the first `add`; call `close` to wait for the queue and stop them.
+    `oncached` is called with each path that made it into the cache, on a worker thread.'''
+    def __init__(self, imagecachebase, getter=None, maxworkers=CACHE_THREADS, oncached=None):
+        self.imagecachebase = imagecachebase
+        self.getter = getter or Getter()
+        self.maxworkers = maxworkers
+        self.oncached = oncached
+        self.stats = CacheStats()
+        self.monitor = xbmc.Monitor()
+        self._queue = Queue(CACHE_QUEUESIZE)
+        self._threads = []
+        self._stop = threading.Event()
+
+    def add(self, path):
+        if not self._threads:
+            self._start()
+        self.stats.queued += 1
+        self._queue.put(path)
+
+    def wait(self):
+        '''Wait for everything added so far, returns the number of images cached.'''
+        if self._threads:
+            self._queue.join()
+        return self.stats.cached
+
+    def drain(self, should_abort, onprogress=None, interval=0.2):
+        '''Like `close`, but stops early if `should_abort` returns True while waiting.
+        `onprogress(done, queued)` is called between checks.'''
+        while self._threads and self._queue.unfinished_tasks:
+            if should_abort():
+                self.abort()
+                return self.stats.cached
+            if onprogress:
+                onprogress(self.stats.cached + self.stats.failed, self.stats.queued)
+            time.sleep(interval)
+        return self.close()
+
+    def close(self):
+        '''Wait for the queue to empty and stop the workers, returns the number of images cached.'''
+        result = self.wait()
+        self._stop.set()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.stats.queued:
+            log(self.stats.summary(), xbmc.LOGINFO)
+        return result
+
+    def abort(self):
+        '''Drop anything still waiting, for when Kodi is closing or the user canceled.'''
+        self._stop.set()
+        self.close()
+
+    def _start(self):
+        self._stop.clear()
+        self.stats.start()
+        for _ in xrange(self.maxworkers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            path = self._queue.get()
+            try:
+                if path is None:
+                    return
+                if not self._stop.is_set():
+                    self._cache(path)
+            finally:
+                self._queue.task_done()
+
+    def _cache(self, path):
+        try:
+            res = self.getter(self.imagecachebase + urllib.quote(pykodi.quoteimage(path), ''), stream=True)
+            if not res:
+                self.stats.add_failed()
+                return
+            size = 0
+            with closing(res):
+                # read it all so the connection goes back to the pool for the next image
+                for chunk in res.iter_content(chunk_size=CHUNK_SIZE):
+                    size += len(chunk)
+            self.stats.add_cached(size)
+            if self.oncached:
+                self.oncached(path)
+        except HTTPError:
+            self.stats.add_failed() # caching error, possibly with decoding the original image
+        except ConnectionError:
+            if self.monitor.abortRequested():
+                self._stop.set() # Kodi is closing
+            else:
+                self.stats.add_failed()
+                log("Connection error caching '{0}'".format(path))
+        except RequestException:
+            self.stats.add_failed()
+        except Exception:
+            self.stats.add_failed()
+            log("Error caching '{0}'".format(path), xbmc.LOGWARNING)
+            log(sys.exc_info()[1], xbmc.LOGWARNING)
+
+class CacheStats(object):
+    def __init__(self):
+        self.queued = 0
+        self.cached = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.started is None:
+            self.started = time.time()
+
+    def add_cached(self, size):
+        with self._lock:
+            self.cached += 1
+            self.bytes += size
+            if self.cached % LOG_EVERY == 0:
+                log(self.summary())
+
+    def add_failed(self):
+        with self._lock:
+            self.failed += 1
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started if self.started else 0
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return (self.cached + self.failed) / elapsed if elapsed else 0
+
+    def summary(self):
+        return "Texture cache: {0} of {1} images cached, {2} failed, {3:0.1f}MB in {4:0.1f}s " \
+            "({5:0.1f} images/s)".format(self.cached, self.queued, self.failed, self.bytes / 1000000.0,
+            self.elapsed, self.rate)
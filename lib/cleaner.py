@@ -1,7 +1,6 @@
 import urllib
-import xbmcvfs
 
-from lib.libs import pykodi, mediatypes, quickjson
+from lib.libs import dirindex, pykodi, mediatypes, quickjson
 from lib.libs.mediainfo import iter_base_arttypes, fill_multiart, keep_arttype
 from lib.libs.addonsettings import settings
 
@@ -27,11 +26,17 @@ def clean_artwork(mediaitem):
             updated_art['discart'] = updated_art['cdart']
             updated_art['cdart'] = None
 
+    localurls = [] if mediaitem.borked_filename else [url for url in updated_art.itervalues()
+        if url and not url.startswith(pykodi.notimagefiles)]
+    # one listdir per folder rather than a stat per file, and parents first so folders that are gone aren't listed
+    for folder in set(dirindex.get_folder(url) for url in localurls):
+        if folder:
+            dirindex.prefetch_parent(folder)
+    existing = dirindex.exists_many(localurls)
     for arttype, url in updated_art.iteritems():
         if not url:
             continue
-        if not url.startswith(pykodi.notimagefiles) and not mediaitem.borked_filename \
-                and not xbmcvfs.exists(url):
+        if url in existing and not existing[url]:
             # Remove local artwork if it is no longer available
             updated_art[arttype] = None
             continue
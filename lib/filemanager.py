@@ -1,6 +1,5 @@
 import os
 import re
-import threading
 import urllib
 try:
     import urllib.parse as urlparse
@@ -12,10 +11,11 @@ from contextlib import closing
 from requests.exceptions import HTTPError, Timeout, ConnectionError, RequestException
 
 from lib import cleaner
-from lib.libs import mediainfo as info, mediatypes, pykodi, quickjson, utils
+from lib.cachewarmer import CacheWarmer
+from lib.libs import dirindex, mediainfo as info, mediatypes, pykodi, quickjson, threadpool, utils
 from lib.libs.addonsettings import settings
 from lib.libs.pykodi import localize as L, log
-from lib.libs.webhelper import Getter
+from lib.libs.webhelper import Getter, shared_session
 
 CANT_CONTACT_PROVIDER = 32034
 HTTP_ERROR = 32035
@@ -24,6 +24,12 @@ REMOTE_CONTROL_REQUIRED = 32039
 
 FILEERROR_LIMIT = 3
 PROVIDERERROR_LIMIT = 3
+# images for one item downloaded at once, each host is also limited by `webhelper.HOST_CONCURRENCY`
+DOWNLOAD_THREADS = 4
+DOWNLOAD_CHUNKSIZE = 64 * 1024
+TEMPFILE_SUFFIX = '.abdownload'
+# an existing image is moved aside to this until the new one is in place
+BACKUP_SUFFIX = '.abreplaced'
 
 TEMP_DIR = 'special://temp/recycledartwork/'
 
@@ -37,13 +43,15 @@ typemap = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif'}
 
 class FileManager(object):
     def __init__(self, debug=False, bigcache=False):
-        self.getter = Getter()
+        self.getter = Getter(session=shared_session('filemanager'))
         self.getter.session.headers['User-Agent'] = settings.useragent
         self.size = 0
         self.fileerror_count = 0
         self.provider_errors = {}
         self.debug = debug
-        self.alreadycached = None if not bigcache else []
+        self.alreadycached = None if not bigcache else set()
+        self._alreadycached_loaded = False
+        self._cachewarmer = None
         self._build_imagecachebase()
 
     def _build_imagecachebase(self):
@@ -88,6 +96,7 @@ class FileManager(object):
         services_hit = False
         error = ''
         localfiles = get_local_art(mediaitem, allartwork)
+        downloads = []
         for arttype, url in to_download.iteritems():
             hostname = urlparse.urlparse(url).netloc
             if self.provider_errors.get(hostname, 0) >= PROVIDERERROR_LIMIT:
@@ -98,51 +107,109 @@ class FileManager(object):
             if self.debug:
                 mediaitem.downloadedart[arttype] = full_basefilepath + '.ext'
                 continue
-            result, err = self.doget(url)
-            if err:
-                error = err
-                self.provider_errors[hostname] = self.provider_errors.get(hostname, 0) + 1
-                continue
-            if not result:
-                # 404 URL dead, wipe it so we can add another one later
-                mediaitem.downloadedart[arttype] = None
-                continue
-            self.size += int(result.headers.get('content-length', 0))
-            services_hit = True
-            ext = get_file_extension(result.headers.get('content-type'), url)
-            if not ext:
-                log("Can't determine extension for '{0}'\nfor image type '{1}'".format(url, arttype))
-                continue
-            full_basefilepath += '.' + ext
-            if xbmcvfs.exists(full_basefilepath):
-                if extrafanart_name_used(full_basefilepath, localfiles):
-                    # REVIEW: can this happen in any other circumstance?
-                    full_basefilepath = get_next_filename(full_basefilepath, localfiles)
-                    localfiles.append(full_basefilepath)
-                if xbmcvfs.exists(full_basefilepath) and settings.recycle_removed:
-                    recyclefile(full_basefilepath)
-            else:
-                folder = os.path.dirname(full_basefilepath)
-                if not xbmcvfs.exists(folder):
-                    xbmcvfs.mkdirs(folder)
-            # For now this just downloads the whole thing in memory, then saves it to file.
-            #  Maybe chunking it will be better when GIFs are handled
-            file_ = xbmcvfs.File(full_basefilepath, 'wb')
-            with closing(file_):
-                if not file_.write(result.content):
+            downloads.append(ImageDownload(arttype, url, full_basefilepath, len(downloads)))
+        for folder in set(os.path.dirname(download.basefilepath) for download in downloads):
+            sweep_leftovers(folder)
+
+        # fetch together to temporary files, then handle results and move files into place in order
+        #  so file names and error counts come out the same as one at a time
+        results = threadpool.map_threaded(self._fetch, downloads, DOWNLOAD_THREADS)
+        try:
+            for download, (_, exc_info) in zip(downloads, results):
+                if exc_info:
+                    threadpool.reraise(exc_info)
+                arttype = download.arttype
+                url = download.url
+                hostname = download.hostname
+                if self.provider_errors.get(hostname, 0) >= PROVIDERERROR_LIMIT:
+                    continue
+                if download.error:
+                    error = download.error
+                    self.provider_errors[hostname] = self.provider_errors.get(hostname, 0) + 1
+                    continue
+                if not download.result:
+                    # 404 URL dead, wipe it so we can add another one later
+                    mediaitem.downloadedart[arttype] = None
+                    continue
+                self.size += download.size
+                services_hit = True
+                if not download.ext:
+                    log("Can't determine extension for '{0}'\nfor image type '{1}'".format(url, arttype))
+                    continue
+                full_basefilepath = download.basefilepath + '.' + download.ext
+                if download.writefailed:
                     self.fileerror_count += 1
                     raise FileError(L(CANT_WRITE_TO_FILE).format(full_basefilepath))
+                if dirindex.exists(full_basefilepath):
+                    if extrafanart_name_used(full_basefilepath, localfiles):
+                        # REVIEW: can this happen in any other circumstance?
+                        full_basefilepath = get_next_filename(full_basefilepath, localfiles)
+                        localfiles.append(full_basefilepath)
+                backupfile = None
+                if dirindex.exists(full_basefilepath):
+                    if settings.recycle_removed:
+                        recyclefile(full_basefilepath)
+                    # rename doesn't replace an existing file everywhere, and if it fails the old image stays
+                    backupfile = full_basefilepath + BACKUP_SUFFIX
+                    if xbmcvfs.exists(backupfile):
+                        xbmcvfs.delete(backupfile)
+                    if not xbmcvfs.rename(full_basefilepath, backupfile):
+                        backupfile = None
+                renamed = xbmcvfs.rename(download.tempfile, full_basefilepath)
+                if backupfile:
+                    if renamed:
+                        xbmcvfs.delete(backupfile)
+                    else:
+                        xbmcvfs.rename(backupfile, full_basefilepath)
+                dirindex.invalidate(full_basefilepath)
+                if not renamed:
+                    self.fileerror_count += 1
+                    raise FileError(L(CANT_WRITE_TO_FILE).format(full_basefilepath))
+                download.tempfile = None
                 self.fileerror_count = 0
-            mediaitem.downloadedart[arttype] = full_basefilepath
-            log("downloaded '{0}'\nto image file '{1}'".format(url, full_basefilepath))
+                mediaitem.downloadedart[arttype] = full_basefilepath
+                log("downloaded '{0}'\nto image file '{1}'".format(url, full_basefilepath))
+        finally:
+            for download in downloads:
+                if download.tempfile and xbmcvfs.exists(download.tempfile):
+                    xbmcvfs.delete(download.tempfile)
         return services_hit, error
 
+    def _fetch(self, download):
+        # runs on download threads, only touches `download`
+        result, err = self.doget(download.url, stream=True)
+        download.result = result
+        download.error = err
+        if err or not result:
+            return
+        with closing(result):
+            download.ext = get_file_extension(result.headers.get('content-type'), download.url)
+            if not download.ext:
+                return
+            folder = os.path.dirname(download.basefilepath)
+            if not dirindex.exists(folder):
+                xbmcvfs.mkdirs(folder)
+                dirindex.invalidate(folder)
+            # partial files never land on the real name, `downloadfor` renames it when it's all here
+            download.tempfile = '{0}.{1}.{2}{3}'.format(download.basefilepath, download.index, download.ext,
+                TEMPFILE_SUFFIX)
+            file_ = xbmcvfs.File(download.tempfile, 'wb')
+            with closing(file_):
+                try:
+                    for chunk in result.iter_content(chunk_size=DOWNLOAD_CHUNKSIZE):
+                        if not file_.write(chunk):
+                            download.writefailed = True
+                            return
+                        download.size += len(chunk)
+                except RequestException:
+                    download.error = L(CANT_CONTACT_PROVIDER)
+
     def doget(self, url, **kwargs):
         try:
             result = self.getter(url, **kwargs)
             if not result and url.startswith('http://'):
                 # Try https, the browser "that totally shows this image" probably is, even if no redirect
-                result, err = self.doget('https://' + url[7:])
+                result, err = self.doget('https://' + url[7:], **kwargs)
                 if err or not result:
                     result = None
             return result, None
@@ -168,54 +235,84 @@ class FileManager(object):
                 continue
             old_url = oldimage['url'] if isinstance(oldimage, dict) else oldimage[0]['url']
             if not old_url or old_url.startswith(pykodi.notimagefiles) \
-            or old_url in mediaitem.selectedart.values() or not xbmcvfs.exists(old_url):
+            or old_url in mediaitem.selectedart.values() or not dirindex.exists(old_url):
                 continue
             if settings.recycle_removed:
                 recyclefile(old_url)
             xbmcvfs.delete(old_url)
+            dirindex.invalidate(old_url)
 
     def set_bigcache(self):
         if self.alreadycached is None:
-            self.alreadycached = []
+            self.alreadycached = set()
 
     def cachefor(self, artmap, multiplethreads=False):
+        '''Add local images in `artmap` to Kodi's texture cache. With `multiplethreads` they are queued
+        for the cache warmer and this returns right away; `finish_caching` waits for them.'''
+        return self.cacheurls(artmap.values(), multiplethreads)
+
+    def cacheurls(self, urls, multiplethreads=False, abort_requested=None):
+        '''`abort_requested` stops caching the rest of `urls` when it returns True.'''
         if not self.imagecachebase or self.debug:
             return 0
-        urls = [url for url in artmap.values() if url and not url.startswith(('http', 'image'))]
+        urls = set(url for url in urls if url and not url.startswith(('http', 'image')))
         if not urls:
             return 0
         if self.alreadycached is not None:
-            if not self.alreadycached:
-                self.alreadycached = [pykodi.unquoteimage(texture['url']) for texture in quickjson.get_textures()
-                    if not pykodi.unquoteimage(texture['url']).startswith(('http', 'image'))]
+            if not self._alreadycached_loaded:
+                self.alreadycached.update(path for path in (pykodi.unquoteimage(texture['url'])
+                    for texture in quickjson.iter_textures()) if not path.startswith(('http', 'image')))
+                self._alreadycached_loaded = True
             alreadycached = self.alreadycached
         else:
-            alreadycached = [pykodi.unquoteimage(texture['url']) for texture in quickjson.get_textures(urls)]
-        count = [0]
-        def worker(path):
-            try:
-                res, _ = self.doget(self.imagecachebase + urllib.quote(pykodi.quoteimage(path), ''), stream=True)
-                if res:
-                    res.iter_content(chunk_size=1024)
-                    res.close()
-                    count[0] += 1
-            except HTTPError:
-                pass # caching error, possibly with decoding the original image
-            except ConnectionError:
-                pass # Kodi is closing
-        threads = []
+            alreadycached = set(pykodi.unquoteimage(texture['url'])
+                for texture in quickjson.get_textures_byurls(urls))
+        urls = [path for path in urls if path not in alreadycached]
+        if multiplethreads:
+            warmer = self._get_cachewarmer()
+            for path in urls:
+                warmer.add(path)
+            return 0
+        count = 0
         for path in urls:
-            if path in alreadycached:
+            if abort_requested and abort_requested():
+                break
+            res, _ = self.doget(self.imagecachebase + urllib.quote(pykodi.quoteimage(path), ''), stream=True)
+            if not res:
                 continue
-            if multiplethreads:
-                t = threading.Thread(target=worker, args=(path,))
-                threads.append(t)
-                t.start()
-            else:
-                worker(path)
-        for t in threads:
-            t.join()
-        return count[0]
+            with closing(res):
+                try:
+                    for _ in res.iter_content(chunk_size=DOWNLOAD_CHUNKSIZE):
+                        pass
+                except RequestException:
+                    continue
+            self._set_cached(path)
+            count += 1
+        return count
+
+    def _set_cached(self, path):
+        # a run over the whole library finds shared images again, like season posters.
+        #  Only images that made it in are kept, so ones that failed are tried again
+        if self.alreadycached is not None:
+            self.alreadycached.add(path)
+
+    def finish_caching(self, abort=False, should_abort=None, onprogress=None):
+        '''Wait for images queued by `cachefor`, returns the number cached. `should_abort` is checked
+        while waiting, see `CacheWarmer.drain`.'''
+        if not self._cachewarmer:
+            return 0
+        if abort:
+            self._cachewarmer.abort()
+        elif should_abort:
+            self._cachewarmer.drain(should_abort, onprogress)
+        else:
+            self._cachewarmer.close()
+        return self._cachewarmer.stats.cached
+
+    def _get_cachewarmer(self):
+        if not self._cachewarmer:
+            self._cachewarmer = CacheWarmer(self.imagecachebase, self.getter, oncached=self._set_cached)
+        return self._cachewarmer
 
 def extrafanart_name_used(path, localfiles):
     return utils.parent_dir(path) == 'extrafanart' and path in localfiles
@@ -261,6 +358,23 @@ def get_local_art(mediaitem, allartwork):
 
     return local
 
+def sweep_leftovers(folder):
+    '''Delete partial downloads left in `folder` by a run that was stopped part way,
+    and put back any image it had moved aside but not yet replaced.'''
+    _, files = dirindex.listdir(folder)
+    leftovers = [filename for filename in files if filename.endswith((TEMPFILE_SUFFIX, BACKUP_SUFFIX))]
+    if not leftovers:
+        return
+    folder += utils.get_pathsep(folder)
+    for filename in leftovers:
+        if filename.endswith(BACKUP_SUFFIX):
+            original = filename[:-len(BACKUP_SUFFIX)]
+            if original not in files and xbmcvfs.rename(folder + filename, folder + original):
+                log("restored image file '{0}'".format(folder + original))
+                continue
+        xbmcvfs.delete(folder + filename)
+    dirindex.invalidate(folder)
+
 def recyclefile(filename):
     firstdir = utils.parent_dir(filename)
     directory = TEMP_DIR
@@ -274,6 +388,20 @@ def recyclefile(filename):
     if not xbmcvfs.copy(filename, recycled_filename):
         raise FileError(L(CANT_WRITE_TO_FILE).format(recycled_filename))
 
+class ImageDownload(object):
+    def __init__(self, arttype, url, basefilepath, index):
+        self.arttype = arttype
+        self.url = url
+        self.hostname = urlparse.urlparse(url).netloc
+        self.basefilepath = basefilepath
+        self.index = index
+        self.result = None
+        self.error = None
+        self.ext = None
+        self.tempfile = None
+        self.size = 0
+        self.writefailed = False
+
 class FileError(Exception):
     def __init__(self, message, cause=None):
         super(FileError, self).__init__()
@@ -1,5 +1,5 @@
 from lib import providers
-from lib.libs import mediatypes
+from lib.libs import mediatypes, threadpool
 from lib.libs.addonsettings import settings
 from lib.libs.mediainfo import keep_arttype
 from lib.libs.pykodi import localize as L
@@ -7,6 +7,7 @@ from lib.libs.utils import SortedDisplay
 from lib.providers import ProviderError
 
 MAX_ERRORS = 3
+PROVIDER_THREADS = 3
 TOO_MANY_ERRORS = 32031
 
 class Gatherer(object):
@@ -14,6 +15,7 @@ class Gatherer(object):
         self.monitor = monitor
         providers.base.languages = languages
         self.providererrors = {}
+        self.ranker = ImageRanker(languages or ())
 
     def getartwork(self, mediaitem, fsonly=False, skipexisting=True):
         services_hit = False
@@ -37,7 +39,7 @@ class Gatherer(object):
                 mediaitem.availableart['poster'] = []
             mediaitem.availableart['poster'].extend(mediaitem.availableart['keyart'])
         for arttype, imagelist in mediaitem.availableart.iteritems():
-            _sort_images(arttype, imagelist, mediaitem.sourcemedia, mediaitem.mediatype)
+            self.ranker.sort_images(arttype, imagelist, mediaitem.sourcemedia, mediaitem.mediatype)
         return services_hit, error
 
     def get_forced_artwork(self, mediaitem, allowmutiple=False):
@@ -70,22 +72,31 @@ class Gatherer(object):
     def get_external_artwork(self, mediatype, seasons, uniqueids, missing=None):
         images = {}
         error = None
-        for provider in providers.external.get(mediatype, ()):
+        useproviders = [provider for provider in providers.external.get(mediatype, ())
+            if self.providererrors.get(provider.name, 0) != MAX_ERRORS]
+        def getimages(provider):
+            if self.monitor.abortRequested():
+                return None
+            return provider.get_images(uniqueids, missing)
+
+        # Query all providers for this item at once, but merge in provider order so results match
+        results = threadpool.map_threaded(getimages, useproviders, PROVIDER_THREADS)
+        for provider, (providerimages, exc_info) in zip(useproviders, results):
             errcount = self.providererrors.get(provider.name, 0)
-            if errcount == MAX_ERRORS:
-                continue
-            try:
-                providerimages = provider.get_images(uniqueids, missing)
-                self.providererrors[provider.name] = 0
-            except ProviderError as ex:
+            if exc_info:
+                if not isinstance(exc_info[1], ProviderError):
+                    threadpool.reraise(exc_info)
                 errcount += 1
                 self.providererrors[provider.name] = errcount
                 error = {'providername': provider.name.display}
                 if errcount == 1: # notify on first error
-                    error['message'] = ex.message
+                    error['message'] = exc_info[1].message
                 elif errcount == MAX_ERRORS: # and on last error when we're no longer going to try this provider
                     error['message'] = L(TOO_MANY_ERRORS)
                 continue
+            if providerimages is None: # skipped after abort
+                continue
+            self.providererrors[provider.name] = 0
             for arttype, artlist in providerimages.iteritems():
                 if arttype.startswith('season.'):
                     season = arttype.rsplit('.', 2)[1]
@@ -95,54 +106,60 @@ class Gatherer(object):
                 if arttype not in images:
                     images[arttype] = []
                 images[arttype].extend(artlist)
-            if self.monitor.abortRequested():
-                break
         return images, error
 
-def _sort_images(basearttype, imagelist, mediasource, mediatype):
-    # 1. Language, preferring fanart with no language/title if configured
-    # 2. Match discart to media source
-    # 3. Preferred source
-    # 4. Size (in 200px groups), up to preferredsize
-    # 5. Rating
-    imagelist.sort(key=lambda image: image['rating'].sort, reverse=True)
-    imagelist.sort(key=_size_sort, reverse=True)
-    if basearttype == 'discart':
-        if mediasource != 'unknown':
-            imagelist.sort(key=lambda image: 0 if image.get('subtype', SortedDisplay(None, '')).sort == mediasource else 1)
-    imagelist.sort(key=lambda image: _preferredsource_sort(image, mediatype), reverse=True)
-    imagelist.sort(key=lambda image: _imagelanguage_sort(image, basearttype))
+class ImageRanker(object):
+    '''Sorts candidate images with one precomputed key for each image. Settings are read once and size
+    keys are shared, so one ranker can cover every item in a run.'''
+    def __init__(self, languages):
+        self.languages = {}
+        for idx, language in enumerate(languages):
+            if language not in self.languages:
+                self.languages[language] = 1.0 * idx / len(languages)
+        self.preferredsize = settings.preferredsize
+        self._sizekeys = {}
 
-def _preferredsource_sort(image, mediatype):
-    result = 1 if mediatypes.ispreferred_source(mediatype, image['provider'][0]) else 0
-    return result
+    def sort_images(self, basearttype, imagelist, mediasource, mediatype):
+        # 1. Language, preferring fanart with no language/title if configured
+        # 2. Match discart to media source
+        # 3. Preferred source
+        # 4. Size (in 200px groups), up to preferredsize
+        # 5. Rating
+        titlefree = basearttype.endswith('fanart') and settings.titlefree_fanart or \
+            basearttype.endswith('poster') and settings.titlefree_poster
+        matchsource = basearttype == 'discart' and mediasource != 'unknown'
+        def sortkey(image):
+            return (self._language_key(image['language'], titlefree), image['language'],
+                0 if mediatypes.ispreferred_source(mediatype, image['provider'][0]) else 1,
+                0 if not matchsource or image.get('subtype', SortedDisplay(None, '')).sort == mediasource else 1,
+                -self._size_key(image['size']), -image['rating'].sort)
+        imagelist.sort(key=sortkey)
 
-def _size_sort(image):
-    imagesplit = image['size'].display.split('x')
+    def _language_key(self, language, titlefree):
+        if not self.languages:
+            return 1
+        result = self.languages.get(language, 1)
+        if language and titlefree:
+            result += 1
+        return result
+
+    def _size_key(self, size):
+        if size not in self._sizekeys:
+            self._sizekeys[size] = _size_sort(size, self.preferredsize)
+        return self._sizekeys[size]
+
+def _size_sort(size, preferredsize):
+    imagesplit = size.display.split('x')
     if len(imagesplit) != 2:
-        return image['size'].sort // 200
+        return size.sort // 200
     try:
         imagesize = int(imagesplit[0]), int(imagesplit[1])
     except ValueError:
-        return image['size'].sort // 200
-    if imagesize[0] > settings.preferredsize[0]:
-        shrink = settings.preferredsize[0] / float(imagesize[0])
-        imagesize = settings.preferredsize[0], imagesize[1] * shrink
-    if imagesize[1] > settings.preferredsize[1]:
-        shrink = settings.preferredsize[1] / float(imagesize[1])
-        imagesize = imagesize[0] * shrink, settings.preferredsize[1]
+        return size.sort // 200
+    if imagesize[0] > preferredsize[0]:
+        shrink = preferredsize[0] / float(imagesize[0])
+        imagesize = preferredsize[0], imagesize[1] * shrink
+    if imagesize[1] > preferredsize[1]:
+        shrink = preferredsize[1] / float(imagesize[1])
+        imagesize = imagesize[0] * shrink, preferredsize[1]
     return max(imagesize) // 200
-
-def _imagelanguage_sort(image, basearttype):
-    if not providers.base.languages:
-        return 1, image['language']
-
-    primarysort = 1 if image['language'] not in providers.base.languages else \
-        1.0 * providers.base.languages.index(image['language']) / len(providers.base.languages)
-
-    if image['language']:
-        if basearttype.endswith('fanart') and settings.titlefree_fanart or \
-                basearttype.endswith('poster') and settings.titlefree_poster:
-            primarysort += 1
-
-    return primarysort, image['language']
@@ -59,6 +59,7 @@ class Settings(object):
         self.cache_local_music_artwork = addon.get_setting('cache_local_music_artwork')
         self.clean_imageurls = addon.get_setting('clean_imageurls')
         self.use_tmdb_keyart = addon.get_setting('use_tmdb_keyart')
+        self.provider_rates = parse_host_rates(addon.get_setting('provider_rates'))
 
         self.language_override = addon.get_setting('language_override')
         if self.language_override == 'None':
@@ -106,4 +107,20 @@ class Settings(object):
         self._autoadd_episodes = value
         addon.set_setting('autoaddepisodes_list', value)
 
+def parse_host_rates(value):
+    '''Host rates from a setting like "api.themoviedb.org=4/10, webservice.fanart.tv=5", as
+    hostname=requests per second, with an optional burst size. Invalid entries are skipped.'''
+    result = {}
+    for entry in value.split(','):
+        hostname, _, rate = entry.partition('=')
+        rate, _, burst = rate.partition('/')
+        try:
+            rate = float(rate)
+            burst = int(burst) if burst.strip() else max(int(rate), 1)
+        except ValueError:
+            continue
+        if hostname.strip() and rate > 0 and burst > 0:
+            result[hostname.strip()] = (rate, burst)
+    return result
+
 settings = Settings()
@@ -0,0 +1,142 @@
+import threading
+import xbmcvfs
+from collections import OrderedDict
+
+from lib.libs.utils import get_pathsep
+
+# folder listings kept at once, the least recently used are dropped past this
+MAX_LISTINGS = 1000
+
+class DirectoryIndex(object):
+    '''Directory listings kept for a run, so file checks in the same folder share one listdir.
+    A folder missing from an already listed parent isn't listed at all.
+    Call `invalidate` after writing files, `clear` at the end of each list of items.'''
+    def __init__(self, maxsize=MAX_LISTINGS):
+        self.maxsize = maxsize
+        self._listings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def listdir(self, path):
+        '''Like `xbmcvfs.listdir`, returns new (dirs, files) lists so callers can sort them.'''
+        listing = self._get_listing(_as_dir(path))
+        return list(listing.dirs), list(listing.files)
+
+    def prefetch(self, path):
+        '''List a folder now so checks for anything in it, or its subfolders, don't need to.'''
+        self._get_listing(_as_dir(path))
+
+    def prefetch_parent(self, path):
+        '''List the folder that `path`, a file or folder, is in. Media folders under the same parent
+        share that listing, and one that is gone isn't listed on its own.'''
+        parent, _ = _split(path)
+        if parent:
+            self._get_listing(parent)
+
+    def exists(self, path):
+        parent, name = _split(path)
+        if not parent:
+            return xbmcvfs.exists(path)
+        return self._exists_in(self._get_listing(parent), path, name)
+
+    def exists_many(self, paths):
+        '''Check several paths with one listdir for each folder, returns {path: exists}.'''
+        byfolder = {}
+        for path in paths:
+            parent, name = _split(path)
+            byfolder.setdefault(parent, []).append((path, name))
+        result = {}
+        for parent, items in byfolder.iteritems():
+            listing = self._get_listing(parent) if parent else None
+            for path, name in items:
+                result[path] = self._exists_in(listing, path, name) if listing else xbmcvfs.exists(path)
+        return result
+
+    def _exists_in(self, listing, path, name):
+        if listing.has(name):
+            return True
+        if listing.missing:
+            return False
+        if listing.empty or name.lower() in listing.lowernames:
+            # an empty listing can be a folder we can't read, and file names may not be case sensitive
+            return xbmcvfs.exists(path)
+        return False
+
+    def invalidate(self, path):
+        '''Forget the listing of `path`'s folder, and of `path` itself if it is a folder. Folders above
+        that didn't have the next one down, like those just made by `xbmcvfs.mkdirs`, are forgotten too.'''
+        with self._lock:
+            self._listings.pop(_as_dir(path), None)
+            parent, name = _split(path)
+            if not parent:
+                return
+            self._listings.pop(parent, None)
+            while True:
+                child = parent
+                parent, name = _split(child)
+                if not parent:
+                    return
+                listing = self._listings.get(parent)
+                if listing and not listing.missing and (listing.has(name) or name.lower() in listing.lowernames):
+                    return # `child` was already there, nothing above it changed
+                self._listings.pop(parent, None)
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+
+    def _get_listing(self, dirpath):
+        with self._lock:
+            listing = self._listings.pop(dirpath, None)
+            if listing is not None:
+                self._listings[dirpath] = listing
+                return listing
+            parent, name = _split(dirpath)
+            parentlisting = self._listings.get(parent) if parent else None
+        if parentlisting and not parentlisting.empty and not parentlisting.has(name) \
+                and name.lower() not in parentlisting.lowernames:
+            listing = Listing((), (), missing=True)
+        else:
+            listing = Listing(*xbmcvfs.listdir(dirpath))
+        with self._lock:
+            self._listings[dirpath] = listing
+            while len(self._listings) > self.maxsize:
+                self._listings.popitem(last=False)
+        return listing
+
+class Listing(object):
+    def __init__(self, dirs, files, missing=False):
+        # `missing` folders aren't in their parent's listing, so nothing in them exists
+        self.missing = missing
+        self.dirs = tuple(dirs)
+        self.files = tuple(files)
+        self.names = frozenset(self.dirs + self.files)
+        self.lowernames = frozenset(name.lower() for name in self.names)
+        self.empty = not self.names
+
+    def has(self, name):
+        return name in self.names
+
+def get_folder(path):
+    '''The folder `path` is in, with a trailing separator.'''
+    return _split(path)[0]
+
+def _as_dir(path):
+    sep = get_pathsep(path)
+    return path if path.endswith(sep) else path + sep
+
+def _split(path):
+    # (parent folder with trailing separator, name)
+    sep = get_pathsep(path)
+    stripped = path.rstrip(sep)
+    if sep not in stripped:
+        return None, stripped
+    parent, name = stripped.rsplit(sep, 1)
+    return parent + sep, name
+
+index = DirectoryIndex()
+listdir = index.listdir
+exists = index.exists
+exists_many = index.exists_many
+prefetch = index.prefetch
+prefetch_parent = index.prefetch_parent
+invalidate = index.invalidate
@@ -4,9 +4,9 @@ import xbmc
 import xbmcvfs
 from functools import wraps
 
-from lib.libs import mediatypes, pykodi, quickjson, utils
+from lib.libs import dirindex, mediatypes, pykodi, quickjson, utils
 from lib.libs.addonsettings import settings
-from lib.libs.mediatypes import _split_arttype as split_arttype
+from lib.libs.mediatypes import _split_arttype as split_arttype, arttype_sortkey
 from lib.libs.pykodi import log, unquoteimage, unquotearchive, localize as L
 
 CANT_FIND_MOVIESET = 32032
@@ -23,14 +23,48 @@ idmap = (('episodeid', mediatypes.EPISODE),
     ('albumid', mediatypes.ALBUM),
     ('artistid', mediatypes.ARTIST))
 
+class _LazyCollection(object):
+    '''Attribute that gets a new empty collection the first time it is read, so items that are
+    never processed don't carry a set of empty dicts and lists.'''
+    def __init__(self, slot, factory):
+        self.slot = slot
+        self.factory = factory
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            value = self.factory()
+            setattr(obj, self.slot, value)
+            return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
+
 class MediaItem(object):
+    # A run over the whole library lists every item, so keep them small
+    __slots__ = ('label', 'file', 'premiered', 'sourcemedia', 'mediatype', 'dbid', 'art', 'uniqueids',
+        'tvshowid', 'showtitle', 'season', 'episode', 'movies', 'albumid', 'artistid', 'artist', 'album',
+        'year', 'seasons', 'error', 'missingid', 'borked_filename', '_skip_artwork', '_discfolders',
+        '_availableart', '_missingart', '_selectedart', '_forcedart', '_updatedart', '_downloadedart')
+
+    skip_artwork = _LazyCollection('_skip_artwork', list)
+    discfolders = _LazyCollection('_discfolders', dict)
+    availableart = _LazyCollection('_availableart', dict)
+    missingart = _LazyCollection('_missingart', list)
+    selectedart = _LazyCollection('_selectedart', dict)
+    forcedart = _LazyCollection('_forcedart', dict)
+    updatedart = _LazyCollection('_updatedart', list)
+    downloadedart = _LazyCollection('_downloadedart', dict)
+
     def __init__(self, jsondata):
         self.label = jsondata['label']
         self.file = unquotearchive(jsondata.get('file'))
         self.premiered = jsondata.get('premiered')
         self.sourcemedia = _get_sourcemedia(self.file)
         self.mediatype, self.dbid = get_mediatype_id(jsondata)
-        self.skip_artwork = []
 
         self.art = get_own_artwork(jsondata)
         self.uniqueids = _get_uniqueids(jsondata, self.mediatype)
@@ -67,16 +101,8 @@ class MediaItem(object):
             self.album = jsondata['label'] if self.mediatype == mediatypes.ALBUM \
                 else jsondata['album'] if self.mediatype == mediatypes.SONG \
                 else None
-            if self.mediatype == mediatypes.ALBUM:
-                self.discfolders = {}
 
         self.seasons = None
-        self.availableart = {}
-        self.missingart = [] # or build this dynamically?
-        self.selectedart = {}
-        self.forcedart = {}
-        self.updatedart = []
-        self.downloadedart = {}
         self.error = None
         self.missingid = False
         self.borked_filename = self.file and '\xef\xbf\xbd' in self.file
@@ -102,16 +128,16 @@ def has_art_todownload(artmap, mediatype):
         if url and url.startswith('http') and mediatypes.downloadartwork(mediatype, arttype)), False)
 
 def arttype_matches_base(arttype, basetype):
-    return re.match(r'{0}\d*$'.format(basetype), arttype)
+    return split_arttype(arttype)[0] == basetype
 
 def iter_urls_for_arttype(art, arttype):
-    for exact in sorted(art, key=utils.natural_sort):
+    for exact in sorted(art, key=arttype_sortkey):
         if arttype_matches_base(exact, arttype):
             yield art[exact]
 
 def iter_base_arttypes(artkeys):
     usedtypes = set()
-    for arttype in sorted(artkeys, key=utils.natural_sort):
+    for arttype in sorted(artkeys, key=arttype_sortkey):
         basetype = get_basetype(arttype)
         if basetype not in usedtypes:
             yield basetype
@@ -127,8 +153,8 @@ def fill_multiart(original_art, basetype, artchanges=((), ())):
     toadd.extend(artchanges[0])
     result.update((atype, None) for atype, url in result.iteritems() if canmove(atype, url))
     if toadd:
-        have = [split_arttype(atype)[1] for atype, url in result.iteritems()
-            if url and arttype_matches_base(atype, basetype)]
+        have = set(split_arttype(atype)[1] for atype, url in result.iteritems()
+            if url and arttype_matches_base(atype, basetype))
         idx = -1
         while toadd:
             idx += 1
@@ -140,47 +166,85 @@ def fill_multiart(original_art, basetype, artchanges=((), ())):
 def item_has_generated_thumbnail(mediaitem):
     return mediaitem.art.get('thumb', '').startswith(pykodi.thumbnailimages)
 
-def iter_missing_arttypes(mediaitem, existingart):
-    fromtypes = [key for key, url in existingart.iteritems() if url]
-    for arttype, artinfo in mediatypes.artinfo[mediaitem.mediatype].iteritems():
-        if arttype in mediaitem.skip_artwork or not artinfo['autolimit']:
-            continue
-        elif artinfo['autolimit'] == 1:
-            if arttype not in fromtypes:
-                yield arttype
-        else:
-            if _has_localart(arttype, existingart, fromtypes):
-                continue # Can't easily tell if existing art matches new URLs, so don't add new on updates
-            artcount = sum(1 for art in fromtypes if arttype_matches_base(art, arttype))
-            if artcount < artinfo['autolimit']:
-                yield arttype
-
-    if mediaitem.mediatype == mediatypes.TVSHOW:
-        seasonartinfo = mediatypes.artinfo.get(mediatypes.SEASON)
-        for season in mediaitem.seasons.iteritems():
-            for arttype, artinfo in seasonartinfo.iteritems():
-                arttype = '%s.%s.%s' % (mediatypes.SEASON, season[0], arttype)
-                if not artinfo['autolimit']:
-                    continue
-                elif artinfo['autolimit'] == 1:
-                    if arttype not in fromtypes:
-                        yield arttype
-                else:
-                    artcount = sum(1 for art in fromtypes if arttype_matches_base(art, arttype))
-                    if artcount < artinfo['autolimit']:
-                        yield arttype
-
-    for arttype in mediatypes.othertypes[mediaitem.mediatype]:
-        if arttype not in mediaitem.skip_artwork and arttype not in fromtypes:
-            yield arttype
-
-def _has_localart(arttype, existingart, fromtypes):
-    for art in fromtypes:
-        if not arttype_matches_base(art, arttype):
-            continue
-        if art in existingart and not existingart[art].startswith(pykodi.notimagefiles):
-            return True
-    return False
+def iter_missing_arttypes(mediaitem, existingart, tables=None):
+    '''`tables` is a dict to keep requirement tables in, shared by every item in a list.'''
+    return iter(get_missingtable(mediaitem.mediatype, tables).missing(mediaitem, existingart))
+
+def get_missing_arttypes(mediaitems, existingarts=None, tables=None):
+    '''Missing art types for each of `mediaitems`, as `iter_missing_arttypes` lists them, checked against
+    `existingarts` (one art dict for each item) or their own art. Settings are read once per media type.'''
+    tables = {} if tables is None else tables
+    return [get_missingtable(mediaitem.mediatype, tables).missing(mediaitem,
+        existingarts[idx] if existingarts else mediaitem.art) for idx, mediaitem in enumerate(mediaitems)]
+
+def get_missingtable(mediatype, tables=None):
+    if tables is None:
+        return _build_missingtable(mediatype)
+    table = tables.get(mediatype)
+    if table is None:
+        # items on other threads may build the same table, either one will do
+        table = tables[mediatype] = _build_missingtable(mediatype)
+    return table
+
+def _build_missingtable(mediatype):
+    # tables are kept for one list, so changed settings apply to the next one
+    typeinfo = mediatypes.artinfo[mediatype]
+    seasoninfo = mediatypes.artinfo[mediatypes.SEASON] if mediatype == mediatypes.TVSHOW else {}
+    return _MissingArtTable(
+        tuple((arttype, info['autolimit']) for arttype, info in typeinfo.iteritems() if info['autolimit']),
+        tuple((arttype, info['autolimit']) for arttype, info in seasoninfo.iteritems() if info['autolimit']),
+        tuple(mediatypes.othertypes[mediatype]))
+
+class _MissingArtTable(object):
+    '''Art types an item of one media type should have, as (arttype, autolimit) in settings order.'''
+    __slots__ = ('required', 'seasonrequired', 'othertypes', 'singles', 'hasmultiple')
+
+    def __init__(self, required, seasonrequired, othertypes):
+        self.required = required
+        self.seasonrequired = seasonrequired
+        self.othertypes = othertypes
+        self.singles = frozenset(arttype for arttype, limit in required if limit == 1) | frozenset(othertypes)
+        self.hasmultiple = any(limit > 1 for _, limit in required + seasonrequired)
+
+    def missing(self, mediaitem, existingart):
+        fromtypes = set(key for key, url in existingart.iteritems() if url)
+        skip = set(mediaitem.skip_artwork)
+        if not self.hasmultiple and not (mediaitem.seasons and self.seasonrequired) \
+                and not self.singles - fromtypes - skip:
+            return []
+        # existing art counted by base type once, rather than matching every key for every art type
+        basecounts = {}
+        localbases = set()
+        if self.hasmultiple:
+            for art in fromtypes:
+                basetype = get_basetype(art)
+                basecounts[basetype] = basecounts.get(basetype, 0) + 1
+                if not existingart[art].startswith(pykodi.notimagefiles):
+                    localbases.add(basetype)
+
+        result = []
+        for arttype, limit in self.required:
+            if arttype in skip:
+                continue
+            elif limit == 1:
+                if arttype not in fromtypes:
+                    result.append(arttype)
+            # Can't easily tell if existing art matches new URLs, so don't add new on updates
+            elif arttype not in localbases and basecounts.get(arttype, 0) < limit:
+                result.append(arttype)
+
+        if mediaitem.mediatype == mediatypes.TVSHOW and mediaitem.seasons:
+            for season in mediaitem.seasons:
+                for arttype, limit in self.seasonrequired:
+                    arttype = '%s.%s.%s' % (mediatypes.SEASON, season, arttype)
+                    if limit == 1:
+                        if arttype not in fromtypes:
+                            result.append(arttype)
+                    elif basecounts.get(arttype, 0) < limit:
+                        result.append(arttype)
+
+        result.extend(arttype for arttype in self.othertypes if arttype not in skip and arttype not in fromtypes)
+        return result
 
 def keep_arttype(mediatype, arttype, arturl):
     mediatype, arttype = mediatypes.hack_mediaarttype(mediatype, arttype)
@@ -190,7 +254,7 @@ def keep_arttype(mediatype, arttype, arturl):
     return arttype in mediatypes.iter_every_arttype(mediatype)
 
 def get_basetype(arttype):
-    return arttype.rstrip('0123456789')
+    return split_arttype(arttype)[0]
 
 def format_arttype(basetype, index):
     return "{0}{1}".format(basetype, index if index else '')
@@ -199,11 +263,14 @@ def update_art_in_library(mediatype, dbid, updatedart):
     if updatedart:
         quickjson.set_item_details(dbid, mediatype, art=updatedart)
 
+def update_many_art_in_library(updates):
+    '''`updates` is an iterable of (mediatype, dbid, updatedart), all sent to Kodi together.'''
+    quickjson.set_many_item_details((dbid, mediatype, {'art': updatedart})
+        for mediatype, dbid, updatedart in updates if updatedart)
+
 def remove_local_from_texturecache(urls, include_generated=False):
     exclude = pykodi.remoteimages if include_generated else pykodi.notimagefiles
-    for url in urls:
-        if url and not url.startswith(exclude):
-            quickjson.remove_texture_byurl(url)
+    quickjson.remove_textures_byurl([url for url in urls if url and not url.startswith(exclude)])
 
 def add_additional_iteminfo(mediaitem, processed, search=None):
     '''Get more data from the Kodi library, processed items, and look up web service IDs.'''
@@ -462,7 +529,10 @@ def find_central_infodir(mediaitem, create=False):
     sep = utils.get_pathsep(basedir)
     mediayear = mediaitem.year if mediaitem.mediatype == mediatypes.MOVIE else None
 
-    mkdir = lambda file_: xbmcvfs.mkdir(os.path.dirname(file_))
+    def mkdir(file_):
+        result = xbmcvfs.mkdir(os.path.dirname(file_))
+        dirindex.invalidate(os.path.dirname(file_))
+        return result
     finish = lambda result: result if not create or mkdir(result) else None
     single_dir = mediaitem.mediatype == mediatypes.MOVIESET and not settings.setartwork_subdirs
     thisdir = _find_existing(basedir, title1, slug1, mediayear, single_dir)
@@ -530,9 +600,8 @@ def cacheit(func):
         return quickcache[key]
     return wrapper
 
-@cacheit
 def get_cached_listdir(path):
-    return xbmcvfs.listdir(path)
+    return dirindex.listdir(path)
 
 @cacheit
 def get_cached_artists(artistname):
@@ -561,3 +630,4 @@ def get_cached_tvshows():
 quickcache = {}
 def clear_cache():
     quickcache.clear()
+    dirindex.index.clear()
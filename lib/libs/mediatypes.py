@@ -1,4 +1,5 @@
 from lib.libs import pykodi
+from lib.libs.utils import natural_sort
 
 TVSHOW = 'tvshow'
 MOVIE = 'movie'
@@ -351,10 +352,28 @@ def downloadanyartwork(mediatype):
         return False
     return any(x for x in info.values() if x['download'])
 
+# art type keys parsed so far; there are only so many of them, and they are checked for every item
+_arttype_parts = {}
+_arttype_sortkeys = {}
+
 def _split_arttype(arttype):
-    basetype = arttype.rstrip('0123456789')
-    idx = 0 if basetype == arttype else int(arttype.replace(basetype, ''))
-    return basetype, idx
+    '''(basetype, index) for an art type, like ('fanart', 2) for 'fanart2' and ('fanart', 0) for 'fanart'.'''
+    try:
+        return _arttype_parts[arttype]
+    except KeyError:
+        basetype = arttype.rstrip('0123456789')
+        result = (basetype, int(arttype[len(basetype):]) if len(basetype) < len(arttype) else 0)
+        _arttype_parts[arttype] = result
+        return result
+
+def arttype_sortkey(arttype):
+    '''Cached `utils.natural_sort` for art type keys.'''
+    try:
+        return _arttype_sortkeys[arttype]
+    except KeyError:
+        result = tuple(natural_sort(arttype))
+        _arttype_sortkeys[arttype] = result
+        return result
 
 def generatethumb(mediatype):
     return togenerate.get(mediatype, False)
@@ -1,10 +1,14 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
 import xbmc
 import xbmcvfs
 
 from lib.libs.addonsettings import settings
 
-VERSION = 1
+VERSION = 2
+# SQLite's default limit on bound parameters is 999
+QUERY_VARIABLE_LIMIT = 500
 # DEPRECATED short 2017-08-26: `medialabel IS NULL` x3 is only for transitioning from VERSION = 0
 #  maybe the first check in `_get_version` can go later on
 
@@ -48,6 +52,74 @@ class ProcessedItems(object):
         return bool(self.db.fetchone("SELECT * FROM processeditems WHERE mediaid=? AND mediatype=?",
             (mediaid, mediatype)))
 
+    def load_index(self, mediatypes=None):
+        '''All rows for `mediatypes` (or everything) in one query, to check many items without a query for each.'''
+        query = "SELECT mediaid, mediatype, medialabel, data, nextdate > datetime('now') AS fresh FROM processeditems"
+        args = ()
+        if mediatypes:
+            query += " WHERE mediatype IN ({0})".format(', '.join('?' * len(mediatypes)))
+            args = tuple(mediatypes)
+        return ProcessedIndex(self.db.fetchall(query, args))
+
+    def set_many(self, updates):
+        '''Upsert many rows in one transaction. `updates` are dicts with mediaid, mediatype, and medialabel,
+        plus 'nextdate' and/or 'data' to set. Columns left out keep their current value.'''
+        updates = list(updates)
+        if not updates:
+            return
+        # read and write together so rows can't change between
+        with self.db.batch():
+            existing = {}
+            bytype = {}
+            for update in updates:
+                bytype.setdefault(update['mediatype'], set()).add(update['mediaid'])
+            for mediatype, mediaids in bytype.iteritems():
+                mediaids = list(mediaids)
+                for idx in xrange(0, len(mediaids), QUERY_VARIABLE_LIMIT):
+                    idchunk = mediaids[idx:idx+QUERY_VARIABLE_LIMIT]
+                    for row in self.db.fetchall("SELECT * FROM processeditems WHERE mediatype=? AND mediaid IN ({0})"
+                            .format(', '.join('?' * len(idchunk))), (mediatype,) + tuple(idchunk)):
+                        existing[(row['mediaid'], row['mediatype'])] = {'nextdate': row['nextdate'], 'data': row['data']}
+
+            rows = {}
+            for update in updates:
+                key = (update['mediaid'], update['mediatype'])
+                row = rows.get(key) or dict(existing.get(key, {'nextdate': None, 'data': None}))
+                row['medialabel'] = update['medialabel']
+                if 'nextdate' in update:
+                    row['nextdate'] = str(update['nextdate']) if update['nextdate'] else None
+                if 'data' in update:
+                    row['data'] = update['data']
+                rows[key] = row
+            self.db.executemany(*(("INSERT OR REPLACE INTO processeditems (mediaid, mediatype, medialabel, nextdate, data)"
+                " VALUES (?, ?, ?, datetime(?), ?)", key + (row['medialabel'], row['nextdate'], row['data']))
+                for key, row in rows.iteritems()))
+
+class ProcessedIndex(object):
+    '''Snapshot of processed items from `ProcessedItems.load_index`, with the same checks as `ProcessedItems`.'''
+    def __init__(self, rows):
+        self.rows = dict(((row['mediaid'], row['mediatype']), row) for row in rows)
+
+    def _get(self, mediaid, mediatype, medialabel):
+        row = self.rows.get((mediaid, mediatype))
+        if row and (row['medialabel'] is None or row['medialabel'] == medialabel):
+            return row
+
+    def is_stale(self, mediaid, mediatype, medialabel):
+        row = self._get(mediaid, mediatype, medialabel)
+        return not row or not row['fresh']
+
+    def get_data(self, mediaid, mediatype, medialabel):
+        row = self._get(mediaid, mediatype, medialabel)
+        if row:
+            return row['data']
+
+    def exists(self, mediaid, mediatype, medialabel):
+        return bool(self._get(mediaid, mediatype, medialabel))
+
+    def does_not_exist(self, mediaid, mediatype, medialabel):
+        return not self.exists(mediaid, mediatype, medialabel)
+
 def upgrade_processeditems(db, fromversion):
     if fromversion == VERSION:
         return VERSION
@@ -56,12 +128,16 @@ def upgrade_processeditems(db, fromversion):
         # new install, build the database fresh
         db.execute("""CREATE TABLE processeditems (mediaid INTEGER NOT NULL, mediatype TEXT NOT NULL,
             medialabel TEXT, nextdate DATETIME, data TEXT, PRIMARY KEY (mediaid, mediatype))""")
+        db.execute("""CREATE INDEX processeditems_mediatype_nextdate ON processeditems (mediatype, nextdate)""")
         return VERSION
 
     workingversion = fromversion
     if workingversion == 0:
         db.execute("""ALTER TABLE processeditems ADD COLUMN medialabel TEXT""")
         workingversion = 1
+    if workingversion == 1:
+        db.execute("""CREATE INDEX processeditems_mediatype_nextdate ON processeditems (mediatype, nextdate)""")
+        workingversion = 2
 
     return workingversion
 
@@ -69,38 +145,75 @@ SETTINGS_TABLE_VALUE = 'database-settings'
 # must be quoted to use as identifier
 SETTINGS_TABLE = '"{0}"'.format(SETTINGS_TABLE_VALUE)
 
+# write-ahead log lets readers carry on during a write, and with it NORMAL only syncs at checkpoints
+JOURNAL_MODE = 'WAL'
+SYNCHRONOUS = 'NORMAL'
+
 class Database(object):
-    def __init__(self, databasename, upgrade_fn):
+    def __init__(self, databasename, upgrade_fn, synchronous=SYNCHRONOUS):
         dbpath = settings.datapath
         if not xbmcvfs.exists(dbpath):
             xbmcvfs.mkdir(dbpath)
         dbpath = xbmc.translatePath(dbpath + databasename + '.db')
-        self._conn = sqlite3.connect(dbpath)
+        # shared by processing stages on other threads, `_lock` keeps the one cursor to one query at a time
+        self._conn = sqlite3.connect(dbpath, check_same_thread=False)
         self._conn.row_factory = sqlite3.Row
         self._conn.text_factory = str
         self._cursor = self._conn.cursor()
+        self._lock = threading.RLock()
+        self._inbatch = False
+        self._set_journaling(synchronous)
         self._setup(upgrade_fn)
 
     def execute(self, query, args=()):
-        with self._conn:
+        with self._lock, self._transaction():
             self._execute_raw(query, args)
 
     def executemany(self, *queriesandargs):
-        with self._conn:
+        with self._lock, self._transaction():
             for queryargs in queriesandargs:
                 self._execute_raw(*queryargs)
 
+    @contextmanager
+    def batch(self):
+        '''Group all writes in this block into one commit. Other threads wait until it's done.'''
+        with self._lock:
+            if self._inbatch:
+                yield
+                return
+            self._inbatch = True
+            try:
+                with self._conn:
+                    yield
+            finally:
+                self._inbatch = False
+
+    @contextmanager
+    def _transaction(self):
+        if self._inbatch:
+            yield # committed with the rest of the batch
+        else:
+            with self._conn:
+                yield
+
     def fetchall(self, query, args=()):
-        self._execute_raw(query, args)
-        return self._cursor.fetchall()
+        with self._lock:
+            self._execute_raw(query, args)
+            return self._cursor.fetchall()
 
     def fetchone(self, query, args=()):
-        self._execute_raw(query, args)
-        return self._cursor.fetchone()
+        with self._lock:
+            self._execute_raw(query, args)
+            return self._cursor.fetchone()
 
     def _execute_raw(self, query, args=()):
         self._cursor.execute(query, args)
 
+    def _set_journaling(self, synchronous):
+        # some file systems, like network shares, can't do WAL, SQLite keeps the old mode then
+        self._execute_raw("PRAGMA journal_mode={0}".format(JOURNAL_MODE))
+        self._execute_raw("PRAGMA synchronous={0}".format(synchronous))
+
     def _setup(self, upgrade_fn):
         version = self._get_version()
         newversion = upgrade_fn(self, version)
@@ -114,14 +227,14 @@ class Database(object):
         )
 
     def _get_version(self):
-        if not self.fetchone("SELECT name FROM sqlite_master WHERE type='table' AND name='processeditems'"):
-            self._build_settings()
-            return -1 # for future databases, this check goes away ...
-        if not self.fetchone("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (SETTINGS_TABLE_VALUE,)):
-            self._build_settings(0) # ... and this is empty
-            return 0 # and returns -1
-
-        return int(self._get_setting_value('database version', 0))
+        if self.fetchone("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (SETTINGS_TABLE_VALUE,)):
+            return int(self._get_setting_value('database version', 0))
+        if self.fetchone("SELECT name FROM sqlite_master WHERE type='table' AND name='processeditems'"):
+            self._build_settings(0) # DEPRECATED: processeditems from before the settings table
+            return 0
+
+        self._build_settings()
+        return -1
 
     def _get_setting_value(self, settingname, default=None):
         result = self.fetchone("SELECT value FROM {0} WHERE name=?".format(SETTINGS_TABLE), (settingname,))
@@ -98,7 +98,8 @@ def datetime_strptime(date_string, format_string):
             return datetime_strptime(date_string, format_string)
 
 def execute_jsonrpc(jsonrpc_command):
-    if isinstance(jsonrpc_command, dict):
+    # a list of requests is sent as one JSON-RPC batch
+    if isinstance(jsonrpc_command, (dict, list)):
         try:
             jsonrpc_command = json.dumps(jsonrpc_command)
         except UnicodeDecodeError:
@@ -236,6 +237,11 @@ class ObjectJSONEncoder(json.JSONEncoder):
             return list(obj)
         if callable(obj):
             return str(obj)
+        slots = [slot for cls in type(obj).__mro__ for slot in getattr(cls, '__slots__', ())]
+        if slots:
+            result = dict((slot.lstrip('_'), getattr(obj, slot)) for slot in slots if hasattr(obj, slot))
+            result['* objecttype'] = str(type(obj))
+            return result
         try:
             result = dict(obj.__dict__)
             result['* objecttype'] = str(type(obj))
@@ -39,6 +39,37 @@ def _upgradeitem(mediaitem, mediatype):
             mediaitem['uniqueid'] = {}
 
 def get_item_details(dbid, mediatype):
+    json_request = _build_get_item_details(dbid, mediatype)
+    json_result = pykodi.execute_jsonrpc(json_request)
+
+    result_key = mediatype + 'details'
+    if check_json_result(json_result, result_key, json_request):
+        result = json_result['result'][result_key]
+        if _needupgrade(mediatype):
+            _upgradeitem(result, mediatype)
+        return result
+
+# items requested together by `iter_item_details`
+DETAILS_BATCHSIZE = 100
+
+def iter_item_details(dbids, mediatype):
+    '''Like `get_item_details` for each of `dbids`, requested in batches. Items that are gone are skipped.'''
+    result_key = mediatype + 'details'
+    dbids = list(dbids)
+    for idx in xrange(0, len(dbids), DETAILS_BATCHSIZE):
+        batch = JSONBatch()
+        for dbid in dbids[idx:idx + DETAILS_BATCHSIZE]:
+            batch.add(_build_get_item_details(dbid, mediatype))
+        for json_request, json_result in batch.execute():
+            if batch.check_result(json_request, json_result, result_key):
+                result = json_result['result'][result_key]
+                if _needupgrade(mediatype):
+                    _upgradeitem(result, mediatype)
+                yield result
+        for ex in batch.errors:
+            log(ex.message)
+
+def _build_get_item_details(dbid, mediatype):
     assert mediatype in typemap
 
     mapped = typemap[mediatype]
@@ -48,16 +79,27 @@ def get_item_details(dbid, mediatype):
     json_request['params']['properties'] = mapped[1]
     if mapped[2]:
         json_request['params'].update(mapped[2])
+    return json_request
+
+def get_item_list(mediatype, extraparams=None, overrideprops=None):
+    json_request = _build_get_item_list(mediatype, extraparams, overrideprops)
     json_result = pykodi.execute_jsonrpc(json_request)
 
-    result_key = mediatype + 'details'
+    result_key = mediatype + 's'
     if check_json_result(json_result, result_key, json_request):
         result = json_result['result'][result_key]
         if _needupgrade(mediatype):
-            _upgradeitem(result, mediatype)
+            for movie in result:
+                _upgradeitem(movie, mediatype)
         return result
+    else:
+        return []
 
-def get_item_list(mediatype, extraparams=None, overrideprops=None):
+def iter_item_list(mediatype, extraparams=None, overrideprops=None):
+    '''Like `get_item_list`, but fetched a page at a time as it is iterated.'''
+    return PagedList(_build_get_item_list(mediatype, extraparams, overrideprops), mediatype + 's', mediatype)
+
+def _build_get_item_list(mediatype, extraparams=None, overrideprops=None):
     assert mediatype in typemap
 
     mapped = typemap[mediatype]
@@ -67,17 +109,7 @@ def get_item_list(mediatype, extraparams=None, overrideprops=None):
     json_request['params']['properties'] = mapped[1] if overrideprops is None else overrideprops
     if extraparams:
         json_request['params'].update(extraparams)
-    json_result = pykodi.execute_jsonrpc(json_request)
-
-    result_key = mediatype + 's'
-    if check_json_result(json_result, result_key, json_request):
-        result = json_result['result'][result_key]
-        if _needupgrade(mediatype):
-            for movie in result:
-                _upgradeitem(movie, mediatype)
-        return result
-    else:
-        return []
+    return json_request
 
 def get_albums(artistname=None, dbid=None):
     if artistname is None or dbid is None:
@@ -99,6 +131,13 @@ def get_songs(mediatype=None, dbid=None, songfilter=None):
         songfilter = {mediatype + 'id': dbid}
     return get_item_list(mediatypes.SONG, {'filter': songfilter})
 
+def iter_songs(mediatype=None, dbid=None, songfilter=None):
+    if songfilter is None and (mediatype is None or dbid is None):
+        return iter_item_list(mediatypes.SONG)
+    if not songfilter:
+        songfilter = {mediatype + 'id': dbid}
+    return iter_item_list(mediatypes.SONG, {'filter': songfilter})
+
 def get_tvshows(moreprops=False, includeprops=True):
     json_request = get_base_json_request('VideoLibrary.GetTVShows')
     if includeprops:
@@ -116,12 +155,8 @@ def get_tvshows(moreprops=False, includeprops=True):
     else:
         return []
 
-def get_episodes(tvshow_id=None, limit=None):
-    json_request = get_base_json_request('VideoLibrary.GetEpisodes')
-    if tvshow_id:
-        json_request['params']['tvshowid'] = tvshow_id
-    json_request['params']['properties'] = typemap[mediatypes.EPISODE][1]
-    json_request['params']['sort'] = {'method': 'dateadded', 'order': 'descending'}
+def get_episodes(tvshow_id=None, limit=None, overrideprops=None):
+    json_request = _build_get_episodes(tvshow_id, overrideprops)
     if limit:
         json_request['params']['limits'] = {'end': limit}
 
@@ -131,6 +166,21 @@ def get_episodes(tvshow_id=None, limit=None):
     else:
         return []
 
+def iter_episodes(tvshow_id=None, extraparams=None, overrideprops=None):
+    '''Like `get_episodes`, but fetched a page at a time as it is iterated.'''
+    json_request = _build_get_episodes(tvshow_id, overrideprops)
+    if extraparams:
+        json_request['params'].update(extraparams)
+    return PagedList(json_request, 'episodes')
+
+def _build_get_episodes(tvshow_id=None, overrideprops=None):
+    json_request = get_base_json_request('VideoLibrary.GetEpisodes')
+    if tvshow_id:
+        json_request['params']['tvshowid'] = tvshow_id
+    json_request['params']['properties'] = overrideprops or typemap[mediatypes.EPISODE][1]
+    json_request['params']['sort'] = {'method': 'dateadded', 'order': 'descending'}
+    return json_request
+
 def get_seasons(tvshow_id=-1):
     if tvshow_id == -1 and pykodi.get_kodi_version() < 17:
         return _get_all_seasons_jarvis()
@@ -156,23 +206,34 @@ def _get_all_seasons_jarvis():
     return result
 
 def set_item_details(dbid, mediatype, **details):
+    json_request = _build_set_item_details(dbid, mediatype, details)
+
+    json_result = pykodi.execute_jsonrpc(json_request)
+    if not check_json_result(json_result, 'OK', json_request):
+        log(json_result)
+
+def set_many_item_details(items):
+    '''Set details for several items in one batch. `items` is an iterable of (dbid, mediatype, details dict).'''
+    batch = JSONBatch()
+    for dbid, mediatype, details in items:
+        batch.add(_build_set_item_details(dbid, mediatype, details))
+    for json_request, json_result in batch.execute():
+        if not batch.check_result(json_request, json_result, 'OK'):
+            log(json_result)
+    batch.raise_errors()
+
+def _build_set_item_details(dbid, mediatype, details):
     assert mediatype in typemap
 
     mapped = typemap[mediatype]
     basestr = 'VideoLibrary.Set{0}Details' if mediatype not in mediatypes.audiotypes else 'AudioLibrary.Set{0}Details'
     json_request = get_base_json_request(basestr.format(mapped[0]))
-    json_request['params'] = details
+    json_request['params'] = dict(details)
     json_request['params'][mediatype + 'id'] = dbid
+    return json_request
 
-    json_result = pykodi.execute_jsonrpc(json_request)
-    if not check_json_result(json_result, 'OK', json_request):
-        log(json_result)
-
-def get_textures(url=None):
-    json_request = get_base_json_request('Textures.GetTextures')
-    json_request['params']['properties'] = ['url']
-    if url is not None:
-        json_request['params']['filter'] = {'field': 'url', 'operator': 'is', 'value': url}
+def get_textures(url=None, filter_=None, properties=('url',)):
+    json_request = _build_get_textures(url, filter_, properties)
 
     json_result = pykodi.execute_jsonrpc(json_request)
     if check_json_result(json_result, 'textures', json_request):
@@ -180,19 +241,81 @@ def get_textures(url=None):
     else:
         return []
 
+def _build_get_textures(url=None, filter_=None, properties=('url',)):
+    json_request = get_base_json_request('Textures.GetTextures')
+    json_request['params']['properties'] = list(properties)
+    if url is not None:
+        filter_ = {'field': 'url', 'operator': 'is', 'value': url}
+    if filter_ is not None:
+        json_request['params']['filter'] = filter_
+    return json_request
+
+# Textures.GetTextures doesn't take `limits`, `iter_textures` pages through ranges of texture IDs instead
+TEXTURE_PAGE_SIZE = 5000
+# URLs matched by one Textures.GetTextures request in `get_textures_byurls`
+TEXTURE_FILTER_SIZE = 100
+
+def iter_textures(pagesize=TEXTURE_PAGE_SIZE):
+    '''All textures with their URL, requested a range of texture IDs at a time. Full details are never
+    decoded for the whole texture database at once, but skipping a gap in IDs lists every remaining ID.'''
+    start = 0
+    while True:
+        textures = get_textures(filter_={'and': [_build_textureid_rule('greaterthan', start),
+            _build_textureid_rule('lessthan', start + pagesize + 1)]})
+        for texture in textures:
+            yield texture
+        if textures:
+            start += pagesize
+            continue
+        # a gap in IDs from removed textures, or the end. IDs alone are small, find where the next page starts
+        textures = get_textures(filter_=_build_textureid_rule('greaterthan', start + pagesize), properties=())
+        if not textures:
+            return
+        start = min(texture['textureid'] for texture in textures) - 1
+
+def _build_textureid_rule(operator, textureid):
+    return {'field': 'textureid', 'operator': operator, 'value': str(textureid)}
+
+def get_textures_byurls(urls):
+    '''Textures for any of `urls`, many URLs to each request and all requests in one batch.'''
+    urls = list(urls)
+    batch = JSONBatch()
+    for idx in xrange(0, len(urls), TEXTURE_FILTER_SIZE):
+        batch.add(_build_get_textures(urls[idx:idx + TEXTURE_FILTER_SIZE]))
+    result = []
+    for json_request, json_result in batch.execute():
+        if batch.check_result(json_request, json_result, 'textures'):
+            result.extend(json_result['result']['textures'])
+    batch.raise_errors()
+    return result
+
 def remove_texture(textureid):
-    json_request = get_base_json_request('Textures.RemoveTexture')
-    json_request['params']['textureid'] = textureid
+    json_request = _build_remove_texture(textureid)
 
     json_result = pykodi.execute_jsonrpc(json_request)
     if not check_json_result(json_result, 'OK', json_request):
         log(json_result)
 
+def _build_remove_texture(textureid):
+    json_request = get_base_json_request('Textures.RemoveTexture')
+    json_request['params']['textureid'] = textureid
+    return json_request
+
 def remove_texture_byurl(url):
     textures = get_textures(url)
     for texture in textures:
         remove_texture(texture['textureid'])
 
+def remove_textures_byurl(urls):
+    '''Remove cached textures for all `urls`, one batch to look them up and one to remove them.'''
+    batch = JSONBatch()
+    for texture in get_textures_byurls(urls):
+        batch.add(_build_remove_texture(texture['textureid']))
+    for json_request, json_result in batch.execute():
+        if not batch.check_result(json_request, json_result, 'OK'):
+            log(json_result)
+    batch.raise_errors()
+
 def get_base_json_request(method):
     return {'jsonrpc': '2.0', 'method': method, 'params': {}, 'id': 1}
 
@@ -216,6 +339,90 @@ def check_json_result(json_result, result_key, json_request):
 
     return 'result' in json_result and (not result_key or result_key in json_result['result'])
 
+# items requested from the library at once by `PagedList`
+PAGE_SIZE = 500
+
+class PagedList(object):
+    '''Library list request that pages through the results with JSON-RPC `limits` as it is iterated,
+    so the whole list is never decoded at once. `len()` is the library's total, from the first page.'''
+    def __init__(self, json_request, result_key, mediatype=None, pagesize=PAGE_SIZE):
+        self.json_request = json_request
+        self.result_key = result_key
+        self.mediatype = mediatype
+        self.pagesize = pagesize
+        self.total = None
+        self._firstpage = None
+
+    def __len__(self):
+        if self.total is None:
+            self._firstpage = self._get_page(0)
+        return self.total
+
+    def __iter__(self):
+        start = 0
+        while True:
+            if not start and self._firstpage is not None:
+                page = self._firstpage
+                self._firstpage = None
+            else:
+                page = self._get_page(start)
+            for item in page:
+                yield item
+            start += len(page)
+            if not page or start >= self.total:
+                return
+
+    def _get_page(self, start):
+        json_request = dict(self.json_request)
+        json_request['params'] = dict(json_request['params'])
+        json_request['params']['limits'] = {'start': start, 'end': start + self.pagesize}
+        json_result = pykodi.execute_jsonrpc(json_request)
+        if not check_json_result(json_result, None, json_request):
+            self.total = start
+            return []
+        # Kodi leaves out the result list entirely if there are no items
+        result = json_result['result'].get(self.result_key, [])
+        self.total = json_result['result'].get('limits', {}).get('total', start + len(result))
+        if self.mediatype and _needupgrade(self.mediatype):
+            for item in result:
+                _upgradeitem(item, self.mediatype)
+        return result
+
+class JSONBatch(object):
+    '''Collects JSON-RPC requests to send to Kodi as one array, rather than a round trip for each.'''
+    def __init__(self):
+        self.json_requests = []
+        self.errors = []
+
+    def add(self, json_request):
+        json_request['id'] = len(self.json_requests) + 1
+        self.json_requests.append(json_request)
+
+    def execute(self):
+        '''Returns a list of (json_request, json_result) in the order requests were added.
+        Check each entry with `check_result` so one failed entry doesn't stop the rest.'''
+        if not self.json_requests:
+            return []
+        json_result = pykodi.execute_jsonrpc(self.json_requests)
+        if isinstance(json_result, dict):
+            # the whole batch was rejected
+            raise JSONException(self.json_requests, json_result)
+        resultmap = dict((result.get('id'), result) for result in json_result)
+        return [(json_request, resultmap.get(json_request['id'], {})) for json_request in self.json_requests]
+
+    def check_result(self, json_request, json_result, result_key):
+        try:
+            return check_json_result(json_result, result_key, json_request)
+        except JSONException as ex:
+            self.errors.append(ex)
+            return False
+
+    def raise_errors(self):
+        for ex in self.errors[1:]:
+            log(ex.message)
+        if self.errors:
+            raise self.errors[0]
+
 class JSONException(Exception):
     def __init__(self, json_request, json_result):
         self.json_request = json_request
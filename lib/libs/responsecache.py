@@ -0,0 +1,96 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from lib.libs.processeditems import Database
+
+VERSION = 0
+# responses that haven't been requested or revalidated for this long are dropped
+PURGE_AFTER = 60 * 24 * 60 * 60
+
+class ResponseCache(object):
+    '''HTTP responses from providers, kept with their validators so stale entries can be
+    refreshed with a conditional request rather than fetched again in full.'''
+    def __init__(self):
+        self.db = Database('responsecache', upgrade_responsecache)
+        self.db.execute("DELETE FROM responsecache WHERE expires < ?", (int(time.time()) - PURGE_AFTER,))
+
+    def get(self, url, ttl, getter, **kwargs):
+        cachekey = build_cachekey(url, kwargs.get('params'), kwargs.get('headers'))
+        cached = self.db.fetchone("SELECT * FROM responsecache WHERE cachekey=?", (cachekey,))
+        if cached and cached['expires'] > time.time():
+            return build_response(url, cached)
+
+        if cached and (cached['etag'] or cached['lastmodified']):
+            headers = dict(kwargs.get('headers') or {})
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['lastmodified']:
+                headers['If-Modified-Since'] = cached['lastmodified']
+            kwargs['headers'] = headers
+        response = getter(url, **kwargs)
+        if response is None:
+            if cached:
+                self.db.execute("DELETE FROM responsecache WHERE cachekey=?", (cachekey,))
+            return None
+        if response.status_code == 304 and cached:
+            self.db.execute("UPDATE responsecache SET expires=? WHERE cachekey=?",
+                (get_expires(ttl), cachekey))
+            return build_response(url, cached)
+        if response.status_code == 200:
+            self.db.execute("""INSERT OR REPLACE INTO responsecache (cachekey, url, etag, lastmodified,
+                contenttype, content, expires) VALUES (?, ?, ?, ?, ?, ?, ?)""", (cachekey, url,
+                response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                response.headers.get('Content-Type'), sqlite3.Binary(response.content), get_expires(ttl)))
+        return response
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get(url, ttl, getter, **kwargs):
+    '''Like `getter(url, **kwargs)`, but serves responses from the cache for `ttl` hours,
+    then revalidates them with the server.'''
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+    return _cache.get(url, ttl, getter, **kwargs)
+
+def build_cachekey(url, params=None, headers=None):
+    # params and headers can hold API keys, so they are hashed into the key rather than stored
+    key = url
+    if params:
+        key += '?' + '&'.join('{0}={1}'.format(k, v) for k, v in sorted(params.iteritems()))
+    if headers:
+        key += '|' + '|'.join('{0}:{1}'.format(k.lower(), v) for k, v in sorted(headers.iteritems()))
+    return hashlib.sha1(key.encode('utf-8') if isinstance(key, unicode) else key).hexdigest()
+
+def build_response(url, cached):
+    response = Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.url = url
+    response.headers = CaseInsensitiveDict()
+    if cached['contenttype']:
+        response.headers['Content-Type'] = cached['contenttype']
+    response.encoding = get_encoding_from_headers(response.headers) or 'utf-8'
+    response._content = str(cached['content'])
+    return response
+
+def get_expires(ttl):
+    return int(time.time() + ttl * 60 * 60)
+
+def upgrade_responsecache(db, fromversion):
+    if fromversion == VERSION:
+        return VERSION
+
+    if fromversion == -1:
+        db.execute("""CREATE TABLE responsecache (cachekey TEXT PRIMARY KEY NOT NULL, url TEXT NOT NULL,
+            etag TEXT, lastmodified TEXT, contenttype TEXT, content BLOB, expires INTEGER NOT NULL)""")
+        return VERSION
+
+    return fromversion
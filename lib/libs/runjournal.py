@@ -0,0 +1,78 @@
+import time
+
+from lib.libs.processeditems import Database
+
+VERSION = 1
+# an interrupted run older than this starts over, items may well have changed since
+MAX_RESUME_AGE = 7 * 24 * 60 * 60
+
+class RunJournal(object):
+    '''Items finished by library-wide runs, so a run that is interrupted can pick up where it stopped.'''
+    def __init__(self):
+        self.db = Database('runjournal', upgrade_runjournal)
+        self.signal = None
+        self._done = set()
+        self._pending = []
+
+    def begin(self, signal, resume=False):
+        '''Start a run. With `resume`, pick up where the last one for `signal` stopped if it didn't finish.'''
+        self.signal = signal
+        self._pending = []
+        if resume and signal in self.interrupted_runs():
+            self._done = set((row['mediaid'], row['mediatype'])
+                for row in self.db.fetchall("SELECT mediaid, mediatype FROM runitems WHERE signal=?", (signal,)))
+        else:
+            self._done = set()
+            self.db.executemany(("DELETE FROM runitems WHERE signal=?", (signal,)),
+                ("INSERT OR REPLACE INTO runs (signal, started) VALUES (?, ?)", (signal, int(time.time()))))
+        return bool(self._done)
+
+    def finish(self):
+        self.db.executemany(("DELETE FROM runitems WHERE signal=?", (self.signal,)),
+            ("DELETE FROM runs WHERE signal=?", (self.signal,)))
+        self.signal = None
+        self._done = set()
+        self._pending = []
+
+    def is_done(self, mediaitem):
+        return (mediaitem.dbid, mediaitem.mediatype) in self._done
+
+    def mark_done(self, mediaitem):
+        key = (mediaitem.dbid, mediaitem.mediatype)
+        if key not in self._done:
+            self._done.add(key)
+            self._pending.append(key)
+
+    def flush(self):
+        if not self.signal or not self._pending:
+            return
+        pending = self._pending
+        self._pending = []
+        self.db.executemany(*(("INSERT OR IGNORE INTO runitems (signal, mediaid, mediatype) VALUES (?, ?, ?)",
+            (self.signal,) + key) for key in pending))
+
+    def interrupted_runs(self):
+        '''Signals of runs that didn't finish, oldest first. Runs too old to resume are dropped.'''
+        expired = int(time.time()) - MAX_RESUME_AGE
+        for row in self.db.fetchall("SELECT signal FROM runs WHERE started IS NULL OR started < ?", (expired,)):
+            self.db.executemany(("DELETE FROM runitems WHERE signal=?", (row['signal'],)),
+                ("DELETE FROM runs WHERE signal=?", (row['signal'],)))
+        return [row['signal'] for row in self.db.fetchall("SELECT signal FROM runs ORDER BY started")]
+
+def upgrade_runjournal(db, fromversion):
+    if fromversion == VERSION:
+        return VERSION
+
+    if fromversion == -1:
+        db.executemany(("CREATE TABLE runs (signal TEXT PRIMARY KEY NOT NULL, started INTEGER)",),
+            ("""CREATE TABLE runitems (signal TEXT NOT NULL, mediaid INTEGER NOT NULL, mediatype TEXT NOT NULL,
+                PRIMARY KEY (signal, mediaid, mediatype))""",))
+        return VERSION
+
+    workingversion = fromversion
+    if workingversion == 0:
+        # runs from before this have no start time, `interrupted_runs` drops them
+        db.execute("ALTER TABLE runs ADD COLUMN started INTEGER")
+        workingversion = 1
+
+    return workingversion
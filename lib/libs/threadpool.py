@@ -0,0 +1,104 @@
+import sys
+import threading
+try:
+    from queue import Queue, Empty, Full
+except ImportError: # py2
+    from Queue import Queue, Empty, Full
+
+def map_threaded(function, items, maxworkers=4):
+    '''Call `function` for each item on a bounded number of threads.
+    Returns a list of (result, exc_info) tuples in the same order as `items`; exc_info is None
+    unless that call raised, so callers can handle each failure on its own.'''
+    items = list(items)
+    results = [None] * len(items)
+    if maxworkers <= 1 or len(items) <= 1:
+        for idx, item in enumerate(items):
+            results[idx] = _call(function, item)
+        return results
+
+    work = Queue()
+    for idx, item in enumerate(items):
+        work.put((idx, item))
+    def worker():
+        while True:
+            try:
+                idx, item = work.get_nowait()
+            except Empty:
+                return
+            results[idx] = _call(function, item)
+
+    threads = [threading.Thread(target=worker) for _ in xrange(min(maxworkers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def reraise(exc_info):
+    raise exc_info[0], exc_info[1], exc_info[2]
+
+def _call(function, item):
+    try:
+        return function(item), None
+    except Exception:
+        return None, sys.exc_info()
+
+_DONE = object()
+
+def run_pipeline(items, stages, finalstage, queuesize=2):
+    '''Pass each item through `stages` in order, each stage on its own thread joined by bounded queues,
+    so several items are in flight at once. `finalstage` is called on the calling thread for each item,
+    in the original order, and can return True to stop early. Stages work on the items in place.'''
+    stop = threading.Event()
+    errors = []
+    outqueues = [Queue(queuesize) for _ in stages]
+
+    def put(queue, item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def get(queue):
+        while not stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                pass
+        return _DONE
+
+    def runstage(stage, source, outqueue):
+        try:
+            for item in source:
+                if stop.is_set():
+                    return
+                stage(item)
+                if not put(outqueue, item):
+                    return
+            put(outqueue, _DONE)
+        except Exception:
+            errors.append(sys.exc_info())
+            stop.set()
+
+    threads = []
+    source = iter(items)
+    for stage, outqueue in zip(stages, outqueues):
+        threads.append(threading.Thread(target=runstage, args=(stage, source, outqueue)))
+        source = iter(lambda queue=outqueue: get(queue), _DONE)
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        for item in source:
+            if finalstage(item):
+                break
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    if errors:
+        reraise(errors[0])
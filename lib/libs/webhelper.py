@@ -1,18 +1,165 @@
 import requests
+import threading
+import time
+import xbmc
+try:
+    import urllib.parse as urlparse
+except ImportError: # py2
+    import urlparse
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
+from lib.libs.addonsettings import settings
+
+# requests in flight at one time to a single host, across all threads
+HOST_CONCURRENCY = 4
+# open connections kept for each host. Streamed downloads hold on to theirs after the host's
+#  semaphore is released, so leave room for those too
+POOL_MAXSIZE = HOST_CONCURRENCY * 2
+# hosts to keep connections open to
+POOL_HOSTS = 20
+
 def retryable_session(retries=3, backoff_factor=0.5, status_forcelist=(500, 502, 504, 520), session=None):
     # from https://www.peterbe.com/plog/best-practice-with-retries-with-requests
     session = session or requests.Session()
-    # 'Retry-After' 413/503/529 headers are respected by default
-    retry = Retry(total=retries, read=retries, connect=retries,
-        backoff_factor=backoff_factor, status_forcelist=status_forcelist)
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = get_adapter(retries, backoff_factor, tuple(status_forcelist))
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
 
+_adapters = {}
+_sessions = {}
+_registry_lock = threading.Lock()
+
+def get_adapter(retries=3, backoff_factor=0.5, status_forcelist=(500, 502, 504, 520)):
+    '''Adapters are shared by every session with the same retry options, so all of them draw from
+    one pool of open connections for each host, rather than connecting and handshaking again.'''
+    key = (retries, backoff_factor, status_forcelist)
+    with _registry_lock:
+        if key not in _adapters:
+            # 'Retry-After' 413/503/529 headers are respected by default
+            retry = Retry(total=retries, read=retries, connect=retries,
+                backoff_factor=backoff_factor, status_forcelist=status_forcelist)
+            _adapters[key] = HTTPAdapter(max_retries=retry, pool_connections=POOL_HOSTS,
+                pool_maxsize=POOL_MAXSIZE)
+        return _adapters[key]
+
+def shared_session(name):
+    '''A session kept for the life of the process, for things that are created again for each run.
+    Headers set on it are seen by everyone using the same `name`.'''
+    with _registry_lock:
+        if name in _sessions:
+            return _sessions[name]
+    session = retryable_session()
+    with _registry_lock:
+        return _sessions.setdefault(name, session)
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+def host_semaphore(hostname):
+    with _host_semaphores_lock:
+        if hostname not in _host_semaphores:
+            _host_semaphores[hostname] = threading.BoundedSemaphore(HOST_CONCURRENCY)
+        return _host_semaphores[hostname]
+
+# requests per second and burst size for API hosts, other hosts are not rate limited
+default_host_rates = {
+    'api.thetvdb.com': (5, 10),
+    'webservice.fanart.tv': (5, 10),
+    'api.themoviedb.org': (4, 10), # TMDB allows 40 requests every 10 seconds
+    'www.theaudiodb.com': (2, 5)
+}
+# wait this long after a 429 response that doesn't say how long with 'Retry-After'
+DEFAULT_RETRYAFTER = 10
+MAX_RETRYAFTER = 120
+# rate limited requests wait in slices this long, so canceling a run doesn't wait for the whole delay
+WAIT_SLICE = 0.5
+
+host_rates = dict(default_host_rates)
+_host_rates_setting = None
+_ratelimiters = {}
+_ratelimiters_lock = threading.Lock()
+_monitor = None
+_abort_requested = None
+
+def _get_monitor():
+    # created on first use, not when this is imported
+    global _monitor
+    if _monitor is None:
+        _monitor = xbmc.Monitor()
+    return _monitor
+
+def set_abort_check(abort_requested=None):
+    '''`abort_requested` is checked while waiting on rate limits, defaults to Kodi closing.'''
+    global _abort_requested
+    _abort_requested = abort_requested
+
+def _abort_check():
+    return (_abort_requested or _get_monitor().abortRequested)()
+
+def _update_host_rates():
+    # the 'provider_rates' setting is read again whenever settings are reloaded
+    global _host_rates_setting
+    if settings.provider_rates is _host_rates_setting:
+        return
+    host_rates.clear()
+    host_rates.update(default_host_rates)
+    host_rates.update(settings.provider_rates)
+    _ratelimiters.clear()
+    _host_rates_setting = settings.provider_rates
+
+def get_ratelimiter(hostname):
+    with _ratelimiters_lock:
+        _update_host_rates()
+        if hostname not in host_rates:
+            return None
+        if hostname not in _ratelimiters:
+            _ratelimiters[hostname] = RateLimiter(*host_rates[hostname])
+        return _ratelimiters[hostname]
+
+class RateLimiter(object):
+    '''Token bucket for one host. Slows down when the host responds with 429 Too Many Requests,
+    then works back up to the configured rate as requests succeed.'''
+    def __init__(self, rate, burst):
+        self.maxrate = float(rate)
+        self.rate = self.maxrate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = max(-self.tokens / self.rate, self.paused_until - now)
+        # a canceled run stops waiting and sends the request, it will stop at its next check anyway
+        end = time.time() + delay
+        while delay > 0 and not _abort_check():
+            _get_monitor().waitForAbort(min(delay, WAIT_SLICE))
+            delay = end - time.time()
+
+    def backoff(self, seconds):
+        with self._lock:
+            self.rate = max(self.rate / 2, self.maxrate / 10)
+            self.tokens = 0
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def succeeded(self):
+        if self.rate < self.maxrate:
+            with self._lock:
+                self.rate = min(self.maxrate, self.rate * 1.1)
+
+def get_retryafter(response):
+    try:
+        return min(int(response.headers.get('Retry-After', DEFAULT_RETRYAFTER)), MAX_RETRYAFTER)
+    except ValueError: # can also be an HTTP date
+        return DEFAULT_RETRYAFTER
+
 class Getter(object):
     def __init__(self, contenttype=None, login=lambda: False, session=None):
         self.session = session or retryable_session()
@@ -24,12 +171,17 @@ class Getter(object):
         # callers still need to handle most `RequestException`s
         if 'timeout' not in kwargs:
             kwargs['timeout'] = 20
-        result = self.session.get(url, **kwargs)
+        result = self._get(url, **kwargs)
         if result is None:
             return
+        if result.status_code == 429:
+            # rate limiter has paused this host, try once more when it's ready
+            result = self._get(url, **kwargs)
+            if result is None:
+                return
         if result.status_code == 401:
             if self.login():
-                result = self.session.get(url, **kwargs)
+                result = self._get(url, **kwargs)
                 if result is None:
                     return
 
@@ -37,3 +189,17 @@ class Getter(object):
             return
         result.raise_for_status()
         return result
+
+    def _get(self, url, **kwargs):
+        hostname = urlparse.urlparse(url).netloc
+        ratelimiter = get_ratelimiter(hostname)
+        if ratelimiter:
+            ratelimiter.acquire()
+        with host_semaphore(hostname):
+            result = self.session.get(url, **kwargs)
+        if ratelimiter and result is not None:
+            if result.status_code == 429:
+                ratelimiter.backoff(get_retryafter(result))
+            else:
+                ratelimiter.succeeded()
+        return result
@@ -1,3 +1,5 @@
+import threading
+
 from lib.libs import mediatypes
 from lib.providers.base import ProviderError
 
@@ -15,28 +17,60 @@ from lib.providers.themoviedb import TheMovieDBMovieProvider, TheMovieDBEpisodeP
 from lib.providers.thetvdbv2 import TheTVDBProvider
 from lib.providers.videofile import VideoFileMovieProvider, VideoFileEpisodeProvider, VideoFileMusicVideoProvider
 
-external = {
-    mediatypes.TVSHOW: (TheTVDBProvider(), FanartTVSeriesProvider()),
-    mediatypes.MOVIE: (TheMovieDBMovieProvider(), FanartTVMovieProvider()),
-    mediatypes.MOVIESET: (TheMovieDBMovieSetProvider(), FanartTVMovieSetProvider()),
-    mediatypes.EPISODE: (TheMovieDBEpisodeProvider(),),
-    mediatypes.MUSICVIDEO: (TheAudioDBMusicVideoProvider(), FanartTVMusicVideoProvider()),
-    mediatypes.ARTIST: (TheAudioDBArtistProvider(), FanartTVArtistProvider()),
-    mediatypes.ALBUM: (TheAudioDBAlbumProvider(), FanartTVAlbumProvider()),
-    mediatypes.SONG: (TheAudioDBSongProvider(),)
-}
-
-forced = {
-    mediatypes.TVSHOW: (ArtFilesSeriesProvider(), NFOFileSeriesProvider()),
-    mediatypes.MOVIE: (ArtFilesMovieProvider(), NFOFileMovieProvider(), VideoFileMovieProvider()),
-    mediatypes.MOVIESET: (ArtFilesMovieSetProvider(), NFOFileMovieSetProvider()),
-    mediatypes.EPISODE: (ArtFilesEpisodeProvider(), NFOFileEpisodeProvider(), VideoFileEpisodeProvider()),
-    mediatypes.MUSICVIDEO: (ArtFilesMusicVideoProvider(), NFOFileMusicVideoProvider(), VideoFileMusicVideoProvider()),
-    mediatypes.ARTIST: (ArtFilesArtistProvider(),),
-    mediatypes.ALBUM: (ArtFilesAlbumProvider(),),
-    mediatypes.SONG: (ArtFilesSongProvider(),)
-}
-
-_tmdbsearch = TheMovieDBSearch()
-search = {mediatypes.MOVIESET: _tmdbsearch, mediatypes.MUSICVIDEO: TheAudioDBSearch(), mediatypes.TVSHOW: _tmdbsearch}
-del _tmdbsearch
+class ProviderRegistry(object):
+    '''Providers for each media type, keyed like a dict. Each provider is created the first time it is
+    asked for, so scripts that work on one item don't set up sessions for every web service.
+    Values are a provider class, or a tuple of them; each class is created only once.'''
+    def __init__(self, classes):
+        self._classes = classes
+        self._providers = {}
+
+    def __getitem__(self, mediatype):
+        if mediatype not in self._providers:
+            classes = self._classes[mediatype]
+            self._providers[mediatype] = tuple(_get_provider(cls) for cls in classes) \
+                if isinstance(classes, tuple) else _get_provider(classes)
+        return self._providers[mediatype]
+
+    def __contains__(self, mediatype):
+        return mediatype in self._classes
+
+    def __nonzero__(self):
+        return bool(self._classes)
+
+    def get(self, mediatype, default=None):
+        return self[mediatype] if mediatype in self._classes else default
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+def _get_provider(cls):
+    with _instances_lock:
+        if cls not in _instances:
+            _instances[cls] = cls()
+        return _instances[cls]
+
+external = ProviderRegistry({
+    mediatypes.TVSHOW: (TheTVDBProvider, FanartTVSeriesProvider),
+    mediatypes.MOVIE: (TheMovieDBMovieProvider, FanartTVMovieProvider),
+    mediatypes.MOVIESET: (TheMovieDBMovieSetProvider, FanartTVMovieSetProvider),
+    mediatypes.EPISODE: (TheMovieDBEpisodeProvider,),
+    mediatypes.MUSICVIDEO: (TheAudioDBMusicVideoProvider, FanartTVMusicVideoProvider),
+    mediatypes.ARTIST: (TheAudioDBArtistProvider, FanartTVArtistProvider),
+    mediatypes.ALBUM: (TheAudioDBAlbumProvider, FanartTVAlbumProvider),
+    mediatypes.SONG: (TheAudioDBSongProvider,)
+})
+
+forced = ProviderRegistry({
+    mediatypes.TVSHOW: (ArtFilesSeriesProvider, NFOFileSeriesProvider),
+    mediatypes.MOVIE: (ArtFilesMovieProvider, NFOFileMovieProvider, VideoFileMovieProvider),
+    mediatypes.MOVIESET: (ArtFilesMovieSetProvider, NFOFileMovieSetProvider),
+    mediatypes.EPISODE: (ArtFilesEpisodeProvider, NFOFileEpisodeProvider, VideoFileEpisodeProvider),
+    mediatypes.MUSICVIDEO: (ArtFilesMusicVideoProvider, NFOFileMusicVideoProvider, VideoFileMusicVideoProvider),
+    mediatypes.ARTIST: (ArtFilesArtistProvider,),
+    mediatypes.ALBUM: (ArtFilesAlbumProvider,),
+    mediatypes.SONG: (ArtFilesSongProvider,)
+})
+
+search = ProviderRegistry({mediatypes.MOVIESET: TheMovieDBSearch, mediatypes.MUSICVIDEO: TheAudioDBSearch,
+    mediatypes.TVSHOW: TheMovieDBSearch})
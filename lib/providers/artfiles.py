@@ -1,12 +1,12 @@
 import os
-import xbmcvfs
 from abc import ABCMeta
 
-from lib.libs import mediatypes
+from lib.libs import dirindex, mediatypes
 from lib.libs.addonsettings import settings
 from lib.libs.mediainfo import arttype_matches_base, format_arttype, find_central_infodir
 from lib.libs.utils import SortedDisplay, natural_sort, get_movie_path_list, get_pathsep, \
     iter_possible_cleannames, parent_dir
+from lib.providers.base import ImageCandidate
 
 ARTWORK_EXTS = ('.jpg', '.png', '.gif')
 ARTIST_INFOFOLDER_PROVIDER = SortedDisplay('file:art', 20223)
@@ -20,20 +20,25 @@ class ArtFilesAbstractProvider(object):
 
     def buildimage(self, url, title, fromartistfolder=False):
         provider = ARTIST_INFOFOLDER_PROVIDER if fromartistfolder else self.name
-        result = {'url': url, 'provider': provider, 'preview': url}
+        result = ImageCandidate(url=url, provider=provider, preview=url)
         result['title'] = title
         result['rating'] = SortedDisplay(0, '')
         result['size'] = SortedDisplay(0, '')
         result['language'] = 'xx'
         return result
 
+    def listdir(self, path):
+        # the parent is listed first, so a media folder that is gone isn't listed on its own
+        dirindex.prefetch_parent(path)
+        return dirindex.listdir(path)
+
     def getextra(self, path, exacttypes, thumbs=False):
         arttype = 'thumb' if thumbs else 'fanart'
         extradir = 'extrathumbs' if thumbs else 'extrafanart'
         sep = get_pathsep(path)
         missing, nextno = getopentypes(exacttypes, arttype)
         path += extradir + sep
-        _, files = xbmcvfs.listdir(path)
+        _, files = self.listdir(path)
         files.sort(key=natural_sort)
         result = {}
         for filename in files:
@@ -54,7 +59,7 @@ class ArtFilesSeriesProvider(ArtFilesAbstractProvider):
 
     def get_exact_images(self, mediaitem):
         path = mediaitem.file
-        dirs, files = xbmcvfs.listdir(path)
+        dirs, files = self.listdir(path)
         files.sort(key=natural_sort)
         result = {}
         for filename in files:
@@ -112,7 +117,7 @@ class ArtFilesMovieProvider(ArtFilesAbstractProvider):
         for dirname, moviefile in (os.path.split(p) for p in paths):
             dirname += sep
             check_moviebase = os.path.splitext(moviefile)[0].lower()
-            dirs, files = xbmcvfs.listdir(dirname)
+            dirs, files = self.listdir(dirname)
             for filename in files:
                 check_filename = filename.lower()
                 if not check_filename.endswith(ARTWORK_EXTS):
@@ -153,14 +158,14 @@ class ArtFilesMovieSetProvider(ArtFilesAbstractProvider):
         path, inputfilename = os.path.split(mediaitem.file)
         sep = get_pathsep(path)
         path += sep
-        dirs, files = xbmcvfs.listdir(path)
+        dirs, files = self.listdir(path)
         check_inputbase = os.path.splitext(inputfilename)[0] if inputfilename else ''
         result = {}
         if inputfilename:
             dirname = next((name for name in dirs if name in iter_possible_cleannames(check_inputbase)), None)
             if dirname: # '[centraldir]/[set name]/[arttype].[ext]'
                 dirname = path + dirname + sep
-                _, dfiles = xbmcvfs.listdir(dirname)
+                _, dfiles = self.listdir(dirname)
                 for filename in dfiles:
                     if not filename.endswith(ARTWORK_EXTS):
                         continue
@@ -204,7 +209,7 @@ class ArtFilesEpisodeProvider(ArtFilesAbstractProvider):
     def get_exact_images(self, mediaitem):
         path, inputfilename = os.path.split(mediaitem.file)
         path += get_pathsep(path)
-        _, files = xbmcvfs.listdir(path)
+        _, files = self.listdir(path)
         check_inputbase = os.path.splitext(inputfilename)[0].lower()
         result = {}
         for filename in files:
@@ -229,7 +234,7 @@ class ArtFilesMusicVideoProvider(ArtFilesAbstractProvider):
     def get_exact_images(self, mediaitem):
         path, inputfilename = os.path.split(mediaitem.file)
         path += get_pathsep(path)
-        dirs, files = xbmcvfs.listdir(path)
+        dirs, files = self.listdir(path)
         check_inputbase = os.path.splitext(inputfilename)[0].lower()
         paths = get_movie_path_list(path)
         result = {}
@@ -276,7 +281,7 @@ class ArtFilesArtistProvider(ArtFilesAbstractProvider):
         path = find_central_infodir(mediaitem)
         if not path:
             return {}
-        _, files = xbmcvfs.listdir(path)
+        _, files = self.listdir(path)
         result = {}
         for filename in files:
             check_filename = filename.lower()
@@ -305,7 +310,7 @@ class ArtFilesAlbumProvider(ArtFilesArtistProvider):
         for path in paths:
             if not path:
                 continue
-            _, files = xbmcvfs.listdir(path)
+            _, files = self.listdir(path)
             for filename in files:
                 check_filename = filename.lower()
                 if not check_filename.endswith(ARTWORK_EXTS):
@@ -321,7 +326,7 @@ class ArtFilesAlbumProvider(ArtFilesArtistProvider):
 
         for disc in sorted(mediaitem.discfolders.keys()):
             path = mediaitem.discfolders[disc]
-            _, files = xbmcvfs.listdir(path)
+            _, files = self.listdir(path)
             for filename in files:
                 check_filename = filename.lower()
                 if not check_filename.endswith(ARTWORK_EXTS):
@@ -361,7 +366,7 @@ class ArtFilesSongProvider(ArtFilesAbstractProvider):
                 continue
             centraldir = path != mediaitem.file
             path = os.path.dirname(path) + get_pathsep(path)
-            _, files = xbmcvfs.listdir(path)
+            _, files = self.listdir(path)
             for filename in files:
                 check_filename = filename.lower()
                 if not check_filename.endswith(ARTWORK_EXTS):
@@ -380,7 +385,7 @@ class ArtFilesSongProvider(ArtFilesAbstractProvider):
         return result
 
 def getopentypes(existingtypes, arttype):
-    keys = [exact for exact in sorted(existingtypes, key=natural_sort)
+    keys = [exact for exact in sorted(existingtypes, key=mediatypes.arttype_sortkey)
         if arttype_matches_base(arttype, exact)]
     missing = []
     nextstart = 0
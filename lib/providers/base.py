@@ -1,10 +1,13 @@
-import StorageServer
+import collections
 import sys
+import threading
 import xbmc
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 from requests.exceptions import Timeout, ConnectionError, RequestException
 from requests.packages import urllib3
 
+from lib.libs import responsecache
 from lib.libs.addonsettings import settings
 from lib.libs.pykodi import log, localize as L
 from lib.libs.utils import SortedDisplay
@@ -17,21 +20,186 @@ urllib3.disable_warnings()
 
 languages = ()
 
-cache = StorageServer.StorageServer('script.artwork.beef', 72)
-monitor = xbmc.Monitor()
-
-# Result of `get_images` is dict of lists, keyed on art type
+# provider responses held in memory for the current run, in front of StorageServer
+MEMO_SIZE = 200
+
+class MemoizedCache(object):
+    '''Bounded LRU in front of `StorageServer.cacheFunction`, shared by all providers, so repeat lookups
+    in a run skip pickling and the round trip to the cache service. Results are shared, don't modify them.
+    The StorageServer is set up on the first miss.'''
+    def __init__(self, maxsize=MEMO_SIZE):
+        self._storage = None
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cacheFunction(self, funct, *args):
+        # keyed on the web service and the request, so providers for different media types that make
+        #  the same request share it, but the same numeric ID for different services doesn't
+        provider = getattr(funct, '__self__', None)
+        service = getattr(getattr(provider, 'name', None), 'sort', type(provider).__name__)
+        key = (service, funct.__name__, repr(args))
+        with self._lock:
+            if key in self._memo:
+                self.hits += 1
+                result = self._memo.pop(key)
+                self._memo[key] = result
+                return result
+            self.misses += 1
+        result = self.get_storage().cacheFunction(funct, *args)
+        with self._lock:
+            self._memo[key] = result
+            while len(self._memo) > self.maxsize:
+                self._memo.popitem(last=False)
+        return result
+
+    def get_storage(self):
+        with self._lock:
+            if self._storage is None:
+                import StorageServer
+                self._storage = StorageServer.StorageServer('script.artwork.beef', 72)
+            return self._storage
+
+    def clear(self):
+        with self._lock:
+            if self.hits or self.misses:
+                log("Provider memo cache: {0} hits, {1} misses".format(self.hits, self.misses))
+            self._memo.clear()
+            self.hits = 0
+            self.misses = 0
+
+cache = MemoizedCache()
+
+# Result of `get_images` is dict of lists of ImageCandidate, keyed on art type
 # {'url': URL, 'language': ISO alpha-2 code, 'rating': SortedDisplay, 'size': SortedDisplay, 'provider': self.name, 'preview': preview URL}
 # 'title': optional image title
 # 'subtype': optional image subtype, like disc dvd/bluray/3d, SortedDisplay
 # language should be None if there is no title on the image
 
+class ImageCandidate(object):
+    '''One image offered by a provider. It has slots rather than a dict of its own to keep long runs small,
+    but it reads and writes like the dicts providers used to return, so selection and the GUI work with either.
+    Only the keys in `__slots__` can be set, a space in a key is an underscore in the slot.'''
+    __slots__ = ('url', 'preview', 'provider', 'rating', 'size', 'language', 'title', 'subtype',
+        'hasseason', 'second_provider', 'existing')
+
+    def __init__(self, *args, **kwargs):
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, _get_slot(key))
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, _get_slot(key), value)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, _get_slot(key))
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key.replace(' ', '_') in _candidate_slots and hasattr(self, key.replace(' ', '_'))
+
+    def __iter__(self):
+        return (slot.replace('_', ' ') for slot in self.__slots__ if hasattr(self, slot))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'ImageCandidate({0!r})'.format(dict(self.iteritems()))
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.Mapping):
+            return NotImplemented
+        return dict(self.iteritems()) == dict(other.iteritems())
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return dict(self.iteritems())
+
+    def __setstate__(self, state):
+        self.update(state)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return list(self)
+
+    def iteritems(self):
+        return ((key, self[key]) for key in self)
+
+    def items(self):
+        return list(self.iteritems())
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        return (self[key] for key in self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).iteritems():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def popitem(self):
+        for key in self:
+            return key, self.pop(key)
+        raise KeyError('popitem(): ImageCandidate is empty')
+
+    def clear(self):
+        for key in self.keys():
+            del self[key]
+
+    def copy(self):
+        return ImageCandidate(self)
+
+collections.MutableMapping.register(ImageCandidate)
+_candidate_slots = frozenset(ImageCandidate.__slots__)
+
+def _get_slot(key):
+    slot = key.replace(' ', '_')
+    if slot not in _candidate_slots:
+        raise KeyError(key)
+    return slot
+
 class AbstractProvider(object):
     __metaclass__ = ABCMeta
 
     name = SortedDisplay(0, '')
     mediatype = None
     contenttype = None
+    # hours to serve responses from the local response cache before revalidating, 0 to skip it
+    cache_ttl = 72
 
     def __init__(self):
         self.getter = Getter(self.contenttype, self.login)
@@ -39,6 +207,8 @@ class AbstractProvider(object):
 
     def doget(self, url, **kwargs):
         try:
+            if self.cache_ttl:
+                return responsecache.get(url, self.cache_ttl, self.getter, **kwargs)
             return self.getter(url, **kwargs)
         except (Timeout, ConnectionError) as ex:
             raise ProviderError, (L(CANT_CONTACT_PROVIDER), ex), sys.exc_info()[2]
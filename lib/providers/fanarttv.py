@@ -3,7 +3,7 @@ import urllib
 import xbmc
 from abc import ABCMeta, abstractmethod
 
-from lib.providers.base import AbstractImageProvider, cache, build_key_error
+from lib.providers.base import AbstractImageProvider, cache, build_key_error, ImageCandidate
 from lib.libs import mediatypes
 from lib.libs.addonsettings import settings
 from lib.libs.pykodi import json, UTF8JSONDecoder
@@ -37,10 +37,11 @@ class FanartTVAbstractProvider(AbstractImageProvider):
             return self._get_images(data)
 
     def get_data(self, mediaid):
-        result = cache.cacheFunction(self._get_data, mediaid)
+        # the API section is passed on so providers on the same section share results
+        result = cache.cacheFunction(self._get_data, self.api_section, mediaid)
         return result if result != 'Empty' else None
 
-    def _get_data(self, mediaid):
+    def _get_data(self, api_section, mediaid):
         apikey = settings.get_apikey('fanarttv')
         if not apikey:
             raise build_key_error('fanarttv')
@@ -48,14 +49,14 @@ class FanartTVAbstractProvider(AbstractImageProvider):
         headers = {'api-key': apikey}
         if settings.fanarttv_clientkey:
             headers['client-key'] = settings.fanarttv_clientkey
-        response = self.doget(self.apiurl % (self.api_section, mediaid), headers=headers)
+        response = self.doget(self.apiurl % (api_section, mediaid), headers=headers)
         return 'Empty' if response is None else json.loads(response.text, cls=UTF8JSONDecoder)
 
     def login(self):
         raise build_key_error('fanarttv')
 
     def build_image(self, url, arttype, image, likediv=5.0):
-        result = {'url': url, 'provider': self.name}
+        result = ImageCandidate(url=url, provider=self.name)
         result['preview'] = url.replace('.fanart.tv/fanart/', '.fanart.tv/preview/')
         result['rating'] = SortedDisplay(5.25 + int(image['likes']) / float(likediv), '{0} likes'.format(image['likes']))
         result['size'] = _get_imagesize(arttype)
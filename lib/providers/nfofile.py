@@ -11,8 +11,9 @@ if sys.version_info < (2, 7):
 else:
     from xml.etree.ElementTree import ParseError
 
-from lib.libs import mediatypes
+from lib.libs import dirindex, mediatypes
 from lib.libs.utils import SortedDisplay, get_movie_path_list
+from lib.providers.base import ImageCandidate
 
 NFO_FILE = 32003
 
@@ -25,7 +26,7 @@ class NFOFileAbstractProvider(object):
             url = url.encode('utf-8')
         if url.startswith('http'):
             url = urllib.quote(url, safe="%/:=&?~#+!$,;'@()*[]")
-        resultimage = {'url': url, 'provider': self.name, 'preview': url}
+        resultimage = ImageCandidate(url=url, provider=self.name, preview=url)
         resultimage['title'] = '<{0}>'.format(title)
         resultimage['rating'] = SortedDisplay(0, '')
         resultimage['size'] = SortedDisplay(0, '')
@@ -157,7 +158,7 @@ class NFOFileMusicVideoProvider(NFOFileAbstractProvider):
         return result
 
 def read_nfofile(filename):
-    if not xbmcvfs.exists(filename):
+    if not dirindex.exists(filename):
         return None
     with closing(xbmcvfs.File(filename)) as nfofile:
         try:
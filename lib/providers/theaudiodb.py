@@ -4,12 +4,13 @@ from lib.libs import mediatypes
 from lib.libs.addonsettings import settings
 from lib.libs.pykodi import json, UTF8JSONDecoder
 from lib.libs.utils import SortedDisplay
-from lib.providers.base import AbstractProvider, AbstractImageProvider, cache, build_key_error
+from lib.providers.base import AbstractProvider, AbstractImageProvider, cache, build_key_error, ImageCandidate
 
 
 class TheAudioDBAbstractProvider(AbstractImageProvider):
     name = SortedDisplay('theaudiodb.com', 'TheAudioDB.com')
     contenttype = 'application/json'
+    cache_ttl = 24 * 7 # music artwork is added slowly
 
     def __init__(self):
         super(TheAudioDBAbstractProvider, self).__init__()
@@ -42,8 +43,8 @@ class TheAudioDBAbstractProvider(AbstractImageProvider):
 
 
     def _build_image(self, url, size, title=None):
-        result = {'provider': self.name, 'url': url, 'preview': url + '/preview',
-            'size': size, 'language': None, 'rating': SortedDisplay(5.1 if title == 'track' else 5.0, '')}
+        result = ImageCandidate(provider=self.name, url=url, preview=url + '/preview',
+            size=size, language=None, rating=SortedDisplay(5.1 if title == 'track' else 5.0, ''))
         if title:
             result['title'] = title
         return result
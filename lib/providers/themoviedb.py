@@ -5,7 +5,7 @@ from lib.libs import mediatypes
 from lib.libs.addonsettings import settings
 from lib.libs.pykodi import json, UTF8JSONDecoder
 from lib.libs.utils import SortedDisplay
-from lib.providers.base import AbstractProvider, AbstractImageProvider, cache, build_key_error
+from lib.providers.base import AbstractProvider, AbstractImageProvider, cache, build_key_error, ImageCandidate
 
 cfgurl = 'https://api.themoviedb.org/3/configuration'
 
@@ -60,7 +60,7 @@ class TheMovieDBAbstractProvider(AbstractImageProvider):
                 continue
             previewbit = 'w300' if arttype in ('backdrops', 'stills') else 'w342'
             for image in artlist:
-                resultimage = {'url': self.baseurl + 'original' + image['file_path'], 'provider': self.name}
+                resultimage = ImageCandidate(url=self.baseurl + 'original' + image['file_path'], provider=self.name)
                 resultimage['preview'] = self.baseurl + previewbit + image['file_path']
                 resultimage['language'] = image['iso_639_1'] if image['iso_639_1'] != 'xx' else None
                 resultimage['rating'] = self._get_rating(image)
@@ -1,14 +1,17 @@
 import re
+import threading
 import xbmc
 from math import pi, sin
 
 from lib.providers import base
-from lib.providers.base import AbstractImageProvider, build_key_error, cache, ProviderError
-from lib.libs import mediatypes
+from lib.providers.base import AbstractImageProvider, build_key_error, cache, ImageCandidate, ProviderError
+from lib.libs import mediatypes, threadpool
 from lib.libs.addonsettings import settings
 from lib.libs.pykodi import json, UTF8JSONDecoder
 from lib.libs.utils import SortedDisplay
 
+REQUEST_THREADS = 4
+
 # designed for version 2.1.0 of TheTVDB API
 class TheTVDBProvider(AbstractImageProvider):
     name = SortedDisplay('thetvdb.com', 'TheTVDB.com')
@@ -22,6 +25,10 @@ class TheTVDBProvider(AbstractImageProvider):
     artmap = {'fanart': 'fanart', 'poster': 'poster', 'season': mediatypes.SEASON + '.%s.poster',
         'seasonwide': mediatypes.SEASON + '.%s.banner', 'series': 'banner'}
 
+    def __init__(self):
+        super(TheTVDBProvider, self).__init__()
+        self._loginlock = threading.Lock()
+
     def get_data(self, mediaid, arttype, language):
         result = cache.cacheFunction(self._get_data, mediaid, arttype, language)
         return result if result != 'Empty' else None
@@ -51,49 +58,59 @@ class TheTVDBProvider(AbstractImageProvider):
         mediaid = get_mediaid(uniqueids)
         if not mediaid:
             return {}
-        result = {}
         languages = base.languages
         # Useful fanart can be hidden by the language filter, try a few of the most frequently used
         flanguages = ['en', 'de', 'fr', 'es', 'ru']
         flanguages.extend(lang for lang in languages if lang not in flanguages)
-        for arttype in self.artmap:
-            if types and not typematches(self.artmap[arttype], types):
+        queries = [(arttype, language) for arttype in self.artmap
+            if not types or typematches(self.artmap[arttype], types)
+            for language in (languages if arttype != 'fanart' else flanguages)]
+        # Uncached shows need a request for each of these, send them together and merge in order
+        responses = threadpool.map_threaded(lambda query: self.get_data(mediaid, *query), queries, REQUEST_THREADS)
+        result = {}
+        for (arttype, language), (data, exc_info) in zip(queries, responses):
+            if exc_info:
+                threadpool.reraise(exc_info)
+            generaltype = self.artmap[arttype]
+            if not data:
                 continue
-            for language in languages if arttype != 'fanart' else flanguages:
-                generaltype = self.artmap[arttype]
-                data = self.get_data(mediaid, arttype, language)
-                if not data:
-                    continue
-                isseason = arttype.startswith('season')
-                if not isseason:
-                    if generaltype not in result:
-                        result[generaltype] = []
-                for image in data['data']:
-                    ntype = generaltype
-                    if isseason:
-                        ntype = ntype % image['subKey']
-                        if ntype not in result:
-                            result[ntype] = []
-                    resultimage = {'provider': self.name}
-                    resultimage['url'] = self.imageurl_base + image['fileName']
-                    resultimage['preview'] = self.imageurl_base + (image['thumbnail'] or '_cache/' + image['fileName'])
-                    resultimage['language'] = language if shouldset_imagelanguage(image) else None
-                    resultimage['rating'] = self._get_rating(image)
-                    if arttype in ('series', 'seasonwide'):
-                        resultimage['size'] = SortedDisplay(758, '758x140')
-                    elif arttype == 'season':
-                        resultimage['size'] = SortedDisplay(1000, '680x1000')
-                    else:
-                        try:
-                            sortsize = int(image['resolution'].split('x')[0 if arttype != 'poster' else 1])
-                        except ValueError:
-                            self.log('whoops, ValueError on "%s"' % image['resolution'])
-                            sortsize = 0
-                        resultimage['size'] = SortedDisplay(sortsize, image['resolution'])
-                    result[ntype].append(resultimage)
+            isseason = arttype.startswith('season')
+            if not isseason:
+                if generaltype not in result:
+                    result[generaltype] = []
+            for image in data['data']:
+                ntype = generaltype
+                if isseason:
+                    ntype = ntype % image['subKey']
+                    if ntype not in result:
+                        result[ntype] = []
+                resultimage = ImageCandidate(provider=self.name)
+                resultimage['url'] = self.imageurl_base + image['fileName']
+                resultimage['preview'] = self.imageurl_base + (image['thumbnail'] or '_cache/' + image['fileName'])
+                resultimage['language'] = language if shouldset_imagelanguage(image) else None
+                resultimage['rating'] = self._get_rating(image)
+                if arttype in ('series', 'seasonwide'):
+                    resultimage['size'] = SortedDisplay(758, '758x140')
+                elif arttype == 'season':
+                    resultimage['size'] = SortedDisplay(1000, '680x1000')
+                else:
+                    try:
+                        sortsize = int(image['resolution'].split('x')[0 if arttype != 'poster' else 1])
+                    except ValueError:
+                        self.log('whoops, ValueError on "%s"' % image['resolution'])
+                        sortsize = 0
+                    resultimage['size'] = SortedDisplay(sortsize, image['resolution'])
+                result[ntype].append(resultimage)
         return result
 
     def login(self):
+        token = self.getter.session.headers.get('authorization')
+        with self._loginlock:
+            if self.getter.session.headers.get('authorization') != token:
+                return True # another request already logged in again
+            return self._login()
+
+    def _login(self):
         response = self.getter.session.post(self.loginurl, json={'apikey': settings.get_apikey('tvdb')},
             headers={'Content-Type': 'application/json', 'User-Agent': settings.useragent}, timeout=15)
         if response is not None and response.status_code == 401:
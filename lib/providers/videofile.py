@@ -6,6 +6,7 @@ from lib.libs import mediatypes
 from lib.libs.addonsettings import settings
 from lib.libs.pykodi import localize as L
 from lib.libs.utils import SortedDisplay, get_movie_path_list
+from lib.providers.base import ImageCandidate
 
 VIDEO_FILE = 32004
 VIDEO_FILE_THUMB = 32005
@@ -16,8 +17,8 @@ class VideoFileAbstractProvider(object):
 
     def build_video_thumbnail(self, path):
         url = build_video_thumbnail_path(path)
-        return {'url': url, 'rating': SortedDisplay(0, ''), 'language': 'xx', 'title': L(VIDEO_FILE_THUMB),
-            'provider': self.name, 'size': SortedDisplay(0, ''), 'preview': url}
+        return ImageCandidate(url=url, rating=SortedDisplay(0, ''), language='xx', title=L(VIDEO_FILE_THUMB),
+            provider=self.name, size=SortedDisplay(0, ''), preview=url)
 
 def build_video_thumbnail_path(videofile):
     if videofile.startswith('image://'):
@@ -35,6 +35,7 @@ DOWNLOAD_COUNT = 32816
 NO_IDS_MESSAGE = 32030
 
 debug = False
+_started = False
 
 def report_startup():
     if not xbmcvfs.exists(settings.datapath):
@@ -191,12 +192,19 @@ def _rotate_file():
     return True
 
 def _get_file(readonly=False):
+    if not readonly:
+        _ensure_started()
     return open(xbmc.translatePath(_get_filepath()), 'r' if readonly else 'a+')
 
+def _ensure_started():
+    # the version line is checked before the first write, rather than when every script starts
+    global _started
+    if not _started:
+        _started = True
+        report_startup()
+
 def _exists(filetag=''):
     return xbmcvfs.exists(_get_filepath(filetag))
 
 def _get_filepath(filetag=''):
     return settings.datapath + REPORT_NAME + ('.' + filetag if filetag else '') + '.txt'
-
-report_startup()
@@ -4,6 +4,7 @@ from lib.artworkprocessor import ArtworkProcessor
 from lib.libs import mediainfo as info, mediatypes, pykodi, quickjson
 from lib.libs.addonsettings import settings
 from lib.libs.processeditems import ProcessedItems
+from lib.libs.runjournal import RunJournal
 from lib.libs.pykodi import log, json
 
 STATUS_IDLE = 'idle'
@@ -11,6 +12,11 @@ STATUS_SIGNALLED = 'signalled'
 STATUS_PROCESSING = 'processing'
 
 ALBUM_CHUNK_SIZE = 200
+# episodes are filtered with just these, full details are only requested for those that pass
+EPISODE_FILTER_PROPERTIES = ['art', 'tvshowid', 'showtitle']
+
+# library-wide runs that pick up where they stopped if interrupted
+RESUMABLE_SIGNALS = ('allvideos', 'allmusic')
 
 addon = pykodi.get_main_addon()
 
@@ -20,6 +26,10 @@ class ArtworkService(xbmc.Monitor):
         self.abort = False
         self.processor = ArtworkProcessor(self)
         self.processed = ProcessedItems()
+        self.journal = RunJournal()
+        # interrupted runs to pick up again after startup, and the one being resumed now
+        self.resume_queue = []
+        self.resuming = None
         self.processaftersettings = False
         self.recentvideos = {'movie': [], 'tvshow': [], 'episode': [], 'musicvideo': []}
         self.stoppeditems = set()
@@ -27,6 +37,8 @@ class ArtworkService(xbmc.Monitor):
         self._status = None
         self._last_videoupdate = addon.get_setting('last_videoupdate')
         self._last_musicupdate = addon.get_setting('last_musicupdate')
+        self._last_videoscan = addon.get_setting('last_videoscan')
+        self._last_musicscan = addon.get_setting('last_musicscan')
         self._check_allepisodes = addon.get_setting('check_allepisodes')
         self.status = STATUS_IDLE
 
@@ -52,6 +64,25 @@ class ArtworkService(xbmc.Monitor):
         addon.set_setting('last_musicupdate', value)
         self._last_musicupdate = value
 
+    @property
+    def last_videoscan(self):
+        # items added to the library before this have all been through a full run
+        return self._last_videoscan
+
+    @last_videoscan.setter
+    def last_videoscan(self, value):
+        addon.set_setting('last_videoscan', value)
+        self._last_videoscan = value
+
+    @property
+    def last_musicscan(self):
+        return self._last_musicscan
+
+    @last_musicscan.setter
+    def last_musicscan(self, value):
+        addon.set_setting('last_musicscan', value)
+        self._last_musicscan = value
+
     @property
     def check_allepisodes(self):
         return self._check_allepisodes
@@ -84,6 +115,7 @@ class ArtworkService(xbmc.Monitor):
         self.recentvideos = {'movie': [], 'tvshow': [], 'episode': [], 'musicvideo': []}
 
     def run(self):
+        self.resume_interrupted()
         while not self.really_waitforabort(5):
             if self.scanning:
                 continue
@@ -95,15 +127,24 @@ class ArtworkService(xbmc.Monitor):
                     self.signal = 'recentvideos_really'
                     continue
                 self.status = STATUS_PROCESSING
+                runstart = get_datetime()
                 if signal == 'allvideos':
-                    if self.process_allvideos():
+                    if self.run_journaled(signal, self.process_allvideos):
+                        self.last_videoscan = runstart
                         notify_finished('Video')
                 elif signal == 'newvideos':
-                    if self.process_allvideos(self.processed.does_not_exist):
+                    if self.process_allvideos(self.processed.load_index().does_not_exist):
+                        self.last_videoscan = runstart
+                        notify_finished('Video')
+                elif signal == 'scannedvideos':
+                    if self.process_allvideos(self.processed.load_index().does_not_exist, self.last_videoscan):
+                        self.last_videoscan = runstart
                         notify_finished('Video')
                 elif signal == 'oldvideos':
-                    if self.process_allvideos(self.processed.is_stale):
+                    index = self.processed.load_index()
+                    if self.process_allvideos(index.is_stale, isknown_fn=index.exists):
                         self.last_videoupdate = get_date()
+                        self.last_videoscan = runstart
                         notify_finished('Video')
                 elif signal == 'localvideos':
                     self.processor.localmode = True
@@ -113,17 +154,65 @@ class ArtworkService(xbmc.Monitor):
                 elif signal == 'recentvideos_really':
                     self.process_recentvideos()
                 elif signal == 'allmusic':
-                    if self.process_allmusic():
+                    if self.run_journaled(signal, self.process_allmusic):
+                        self.last_musicscan = runstart
                         notify_finished('Music')
                 elif signal == 'newmusic':
-                    if self.process_allmusic(self.processed.does_not_exist):
+                    if self.process_allmusic(self.processed.load_index().does_not_exist):
+                        self.last_musicscan = runstart
+                        notify_finished('Music')
+                elif signal == 'scannedmusic':
+                    if self.process_allmusic(self.processed.load_index().does_not_exist, self.last_musicscan):
+                        self.last_musicscan = runstart
                         notify_finished('Music')
                 elif signal == 'oldmusic':
-                    if self.process_allmusic(self.processed.is_stale):
+                    if self.process_allmusic(self.processed.load_index().is_stale):
                         self.last_musicupdate = get_date()
+                        self.last_musicscan = runstart
                         notify_finished('Music')
 
                 self.status = STATUS_IDLE
+            else:
+                self.resume_next()
+
+    def resume_interrupted(self):
+        '''Queue every interrupted run to pick up again, only called at startup.'''
+        self.resume_queue = [signal for signal in self.journal.interrupted_runs()
+            if signal == 'allvideos' and settings.enableservice
+            or signal == 'allmusic' and settings.enableservice_music]
+        self.resume_next()
+
+    def resume_next(self):
+        if self.signal or not self.resume_queue:
+            return
+        signal = self.resume_queue.pop(0)
+        log("Resuming interrupted '{0}' run".format(signal), xbmc.LOGINFO)
+        self.resuming = signal
+        self.processor.create_progress()
+        self.signal = signal
+
+    def request_run(self, signal):
+        # a run the user asked for starts fresh, even if an interrupted one was waiting to resume
+        if signal in self.resume_queue:
+            self.resume_queue.remove(signal)
+        if self.resuming == signal:
+            self.resuming = None
+        self.processor.create_progress()
+        self.signal = signal
+
+    def run_journaled(self, signal, process_fn):
+        assert signal in RESUMABLE_SIGNALS
+        resume = self.resuming == signal
+        self.resuming = None
+        self.journal.begin(signal, resume)
+        self.processor.journal = self.journal
+        try:
+            finished = process_fn()
+        finally:
+            self.processor.journal = None
+        if finished:
+            self.journal.finish()
+        return finished
 
     def abortRequested(self):
         return self.waitForAbort(0.0001)
@@ -150,8 +239,7 @@ class ArtworkService(xbmc.Monitor):
             self.processor.create_progress()
             self.signal = 'oldvideos'
         elif method == 'Other.ProcessAllVideos':
-            self.processor.create_progress()
-            self.signal = 'allvideos'
+            self.request_run('allvideos')
         elif method == 'Other.ProcessLocalVideos':
             self.processor.create_progress()
             self.signal = 'localvideos'
@@ -168,7 +256,7 @@ class ArtworkService(xbmc.Monitor):
         elif method == 'VideoLibrary.OnScanFinished':
             if settings.enableservice:
                 scan_olditems = settings.enable_olditem_updates and get_date() > self.last_videoupdate
-                self.signal = 'oldvideos' if scan_olditems else 'newvideos'
+                self.signal = 'oldvideos' if scan_olditems else 'scannedvideos'
                 self.processor.create_progress()
         elif method == 'VideoLibrary.OnUpdate':
             if not settings.enableservice:
@@ -186,7 +274,7 @@ class ArtworkService(xbmc.Monitor):
             if method == 'AudioLibrary.OnScanFinished':
                 if settings.enableservice_music:
                     scan_olditems = settings.enable_olditem_updates and get_date() > self.last_musicupdate
-                    self.signal = 'oldmusic' if scan_olditems else 'newmusic'
+                    self.signal = 'oldmusic' if scan_olditems else 'scannedmusic'
             elif method == 'Other.ProcessNewMusic':
                 self.processor.create_progress()
                 self.signal = 'newmusic'
@@ -194,36 +282,40 @@ class ArtworkService(xbmc.Monitor):
                 self.processor.create_progress()
                 self.signal = 'oldmusic'
             elif method == 'Other.ProcessAllMusic':
-                self.processor.create_progress()
-                self.signal = 'allmusic'
+                self.request_run('allmusic')
 
     def watchitem(self, data):
         can_use_data = 'item' in data and data['item'].get('id') and data['item'].get('id') != -1
         return can_use_data and 'playcount' not in data and data['item'].get('type') in self.recentvideos \
             and (pykodi.get_kodi_version() < 18 or data.get('added'))
 
-    def process_allvideos(self, shouldinclude_fn=None):
+    def process_allvideos(self, shouldinclude_fn=None, since=None, isknown_fn=None):
+        '''`since` limits movies, music videos, and episodes to those added to the library after it.
+        Items that pass `isknown_fn` have been through a run before, they are only rechecked
+        if they are missing artwork.'''
         allvideos = self.check_allepisodes
         if not shouldinclude_fn:
             allvideos = True
             shouldinclude_fn = lambda id, type, label: True
+        addedfilter = build_addedfilter(since)
         items = []
         if not mediatypes.disabled(mediatypes.MOVIESET):
-            items.extend(info.MediaItem(mset) for mset in quickjson.get_item_list(mediatypes.MOVIESET)
+            items.extend(info.MediaItem(mset) for mset in quickjson.iter_item_list(mediatypes.MOVIESET)
                 if shouldinclude_fn(mset['setid'], mediatypes.MOVIESET, mset['label']))
         if not mediatypes.disabled(mediatypes.MOVIE):
-            items.extend(info.MediaItem(movie) for movie in quickjson.get_item_list(mediatypes.MOVIE)
+            items.extend(info.MediaItem(movie) for movie in quickjson.iter_item_list(mediatypes.MOVIE, addedfilter)
                 if shouldinclude_fn(movie['movieid'], mediatypes.MOVIE, movie['label']))
         if not mediatypes.disabled(mediatypes.MUSICVIDEO):
-            items.extend(info.MediaItem(mvid) for mvid in quickjson.get_item_list(mediatypes.MUSICVIDEO)
+            items.extend(info.MediaItem(mvid) for mvid in quickjson.iter_item_list(mediatypes.MUSICVIDEO, addedfilter)
                 if shouldinclude_fn(mvid['musicvideoid'], mediatypes.MUSICVIDEO, info.build_music_label(mvid)))
 
         serieslist = quickjson.get_tvshows()
         if self.abortRequested():
             return False
         if not mediatypes.disabled(mediatypes.TVSHOW):
+            processed = self.processed.load_index((mediatypes.TVSHOW,))
             for series in serieslist:
-                processed_season = self.processed.get_data(series['tvshowid'], mediatypes.TVSHOW, series['label'])
+                processed_season = processed.get_data(series['tvshowid'], mediatypes.TVSHOW, series['label'])
                 if not processed_season or series['season'] > int(processed_season) \
                 or shouldinclude_fn(series['tvshowid'], mediatypes.TVSHOW, series['label']):
                     items.append(info.MediaItem(series))
@@ -231,20 +323,34 @@ class ArtworkService(xbmc.Monitor):
                     return False
         if include_any_episode():
             seriesmap = dict((s['tvshowid'], s['imdbnumber']) for s in serieslist)
-            episodes = []
-            for episode in (quickjson.get_episodes() if allvideos else quickjson.get_episodes(limit=500)):
-                ep = info.MediaItem(episode)
-                if seriesmap.get(ep.tvshowid) in settings.autoadd_episodes or include_episode(ep):
-                    episodes.append(ep)
-            self.check_allepisodes = len(episodes) > 400
-            for episode in episodes:
+            episodeids = []
+            matchcount = 0
+            for episode in (quickjson.iter_episodes(extraparams=addedfilter, overrideprops=EPISODE_FILTER_PROPERTIES)
+                    if allvideos or since else quickjson.get_episodes(limit=500, overrideprops=EPISODE_FILTER_PROPERTIES)):
+                if seriesmap.get(episode['tvshowid']) in settings.autoadd_episodes:
+                    matchcount += 1
+                    # same label as MediaItem
+                    if shouldinclude_fn(episode['episodeid'], mediatypes.EPISODE,
+                            episode['showtitle'] + ' - ' + episode['label']):
+                        episodeids.append(episode['episodeid'])
+                elif include_episode_json(episode):
+                    matchcount += 1
+                    episodeids.append(episode['episodeid'])
+            if not since:
+                self.check_allepisodes = matchcount > 400
+            if self.abortRequested():
+                return False
+            for episode in quickjson.iter_item_details(episodeids, mediatypes.EPISODE):
+                episode = info.MediaItem(episode)
                 if seriesmap.get(episode.tvshowid) not in settings.autoadd_episodes:
                     episode.skip_artwork = ['fanart']
-                    items.append(episode)
-                elif shouldinclude_fn(episode.dbid, mediatypes.EPISODE, episode.label):
-                    items.append(episode)
+                items.append(episode)
                 if self.abortRequested():
                     return False
+        if isknown_fn:
+            # new items always go through, to clean art and pick up local files
+            items, complete = split_complete(items, isknown_fn)
+            self.processor.set_complete(complete)
         self.reset_recent()
         return self.processor.process_medialist(items)
 
@@ -300,20 +406,22 @@ class ArtworkService(xbmc.Monitor):
         self.reset_recent()
         self.processor.process_medialist(newitems)
 
-    def process_allmusic(self, shouldinclude_fn=None):
+    def process_allmusic(self, shouldinclude_fn=None, since=None):
+        '''`since` limits albums, and their songs, to those added to the library after it.'''
         if mediatypes.disabled(mediatypes.ALBUM) and mediatypes.disabled(mediatypes.ARTIST):
             return True
         if not shouldinclude_fn:
             shouldinclude_fn = lambda id, type, label: True
         albums = []
         if not mediatypes.disabled(mediatypes.ALBUM):
-            albums.extend(info.MediaItem(album) for album in quickjson.get_albums()
+            albums.extend(info.MediaItem(album) for album in
+                quickjson.iter_item_list(mediatypes.ALBUM, build_addedfilter(since))
                 if shouldinclude_fn(album['albumid'], mediatypes.ALBUM, info.build_music_label(album)))
         if self.abortRequested():
             return False
         artists = []
         if not mediatypes.disabled(mediatypes.ARTIST):
-            artists.extend(info.MediaItem(artist) for artist in quickjson.get_item_list(mediatypes.ARTIST)
+            artists.extend(info.MediaItem(artist) for artist in quickjson.iter_item_list(mediatypes.ARTIST)
                 if shouldinclude_fn(artist['artistid'], mediatypes.ARTIST, artist['label']))
         if self.abortRequested():
             return False
@@ -356,6 +464,17 @@ class ArtworkService(xbmc.Monitor):
 def get_date():
     return pykodi.get_infolabel('System.Date(yyyy-mm-dd)')
 
+def get_datetime():
+    # same format and local time as library 'dateadded'
+    return pykodi.datetime_now().strftime('%Y-%m-%d %H:%M:%S')
+
+def build_addedfilter(since):
+    # Kodi can set `dateadded` from file times, so an item from the last scan can be dated before `since`.
+    #  Those are left for old-item runs and "new videos" runs, which check the whole library
+    if not since:
+        return None
+    return {'filter': {'field': 'dateadded', 'operator': 'after', 'value': since}}
+
 def notify_finished(content):
     pykodi.execute_builtin('NotifyAll(script.artwork.beef, On{0}ProcessingFinished)'.format(content))
 
@@ -368,13 +487,34 @@ def include_episode(episode):
     return mediatypes.generatethumb(mediatypes.EPISODE) and not info.item_has_generated_thumbnail(episode) \
         or info.has_art_todownload(episode.art, mediatypes.EPISODE)
 
+def split_complete(mediaitems, isknown_fn):
+    '''(items to process, known items with nothing missing, to download, or to generate). Series always
+    go through, their seasons aren't loaded yet.'''
+    missing = info.get_missing_arttypes(mediaitems)
+    incomplete = []
+    complete = []
+    for mediaitem, missingart in zip(mediaitems, missing):
+        if missingart or mediaitem.mediatype == mediatypes.TVSHOW \
+                or not isknown_fn(mediaitem.dbid, mediaitem.mediatype, mediaitem.label) \
+                or mediatypes.generatethumb(mediaitem.mediatype) and not info.item_has_generated_thumbnail(mediaitem) \
+                or info.has_art_todownload(mediaitem.art, mediaitem.mediatype):
+            incomplete.append(mediaitem)
+        else:
+            complete.append(mediaitem)
+    return incomplete, complete
+
+def include_episode_json(episode):
+    '''`include_episode` for an episode straight from JSON-RPC, before building a MediaItem for it.'''
+    return mediatypes.generatethumb(mediatypes.EPISODE) and not info.has_generated_thumbnail(episode) \
+        or info.has_art_todownload(info.get_own_artwork(episode), mediatypes.EPISODE)
+
 def _buildsongs(albumgroup):
     result = {}
     if mediatypes.disabled(mediatypes.SONG):
         return result
     songfilter = {'field': 'album', 'operator': 'is',
         'value': [album.label for album in albumgroup]}
-    for song in quickjson.get_songs(songfilter=songfilter):
+    for song in quickjson.iter_songs(songfilter=songfilter):
         if song['albumid'] not in result:
             result[song['albumid']] = []
         result[song['albumid']].append(song)